@@ -10,6 +10,9 @@
 
 
 from typing import List
+from array import array
+import hashlib
+import random
 
 # Define characters for the elements in the puzzle
 CHAR_WALL = '#'
@@ -19,11 +22,188 @@ CHAR_BOX_IN_STORAGE = '*' # a box is at a storage point.
 CHAR_ROBOT = 'a'
 CHAR_ROBOT_IN_STORAGE = 'A' # a robot is at a storage point.
 
+# The four unit moves as (dx, dy) offsets, in the order successors are generated.
+DIRECTIONS = ((1, 0), (0, 1), (-1, 0), (0, -1))
+
+# Distance recorded for cells from which a box cannot reach a storage point.
+UNREACHABLE = 1 << 30
+
+# Seed for the Zobrist keys, fixed so that state keys are reproducible between runs.
+ZOBRIST_SEED = 384
+
+
+def iter_cells(mask):
+    """
+    Yields the cell index of every bit set in a packed cell mask, lowest cell first.
+
+    :param mask: a packed set of cell indices (bit i set means cell i is in the set).
+    :type mask: int
+    """
+    while mask:
+        low = mask & -mask
+        yield low.bit_length() - 1
+        mask ^= low
+
+
+class Level:
+    """
+    The static part of a Sokoban puzzle: its name, dimensions, walls, storage points and
+    the tables derived from them. A level is built once per puzzle and shared by every
+    board of that puzzle.
+
+    Cells are addressed by a single index, y * width + x. One extra cell at index
+    width * height stands in for everything off the grid; it is a wall and every step from
+    it leads back to it, so cell lookups never need bounds checks.
+
+    The level also holds the Zobrist keys of the puzzle: a random 64-bit number for a robot
+    and for a box on each cell. The key of a board is the XOR of the numbers of its robots
+    and boxes, so moving a robot or a box updates the key with two XORs. Robots are
+    interchangeable, so the key does not depend on which robot stands where.
+
+    Finally, the level precomputes, for each storage point, the push distance from every cell:
+    the fewest pushes that take a box from the cell to the storage point on an otherwise empty
+    level, assuming the robot can always get behind the box. The tables are flat arrays,
+    with the distances to the storage point goal_cells[g] at offsets g * (size + 1) onwards,
+    together with the nearest push distance and the nearest Manhattan distance to any storage
+    point per cell. Cells that no storage point can be reached from are dead: pushing a box
+    onto one can never lead to a solution.
+
+    Tunnel cells are also marked per axis, in tunnels[0] for horizontal and tunnels[1] for
+    vertical moves: a cell that is not a storage point and has walls on both sides across the
+    axis, so that a box on it can only be pushed further along the axis. The macro moves of
+    get_successors push boxes through them in one go.
+
+    Search code may keep per-puzzle results, such as heuristic solutions, in the `memo` dict.
+    """
+
+    __slots__ = ('name', 'width', 'height', 'size', 'storage', 'obstacles', 'walls', 'goals', 'goal_mask',
+                 'xy', 'steps', 'box_keys', 'robot_keys', 'goal_cells', 'push_distances', 'nearest_push',
+                 'nearest_manhattan', 'dead', 'tunnels', 'memo', 'template')
+
+    def __init__(self, name: str, width: int, height: int, storage: List[tuple], obstacles: List[tuple]):
+        """
+        :param name: the name of the puzzle
+        :type name: str
+        :param width: the width of the puzzle
+        :type width: int
+        :param height: the height of the puzzle
+        :type height: int
+        :param storage: positions for all the storage points in a list.
+        :type storage: List[tuple]
+        :param obstacles: locations of all of the obstacles (i.e. walls) in a list.
+        :type obstacles: List[tuple]
+        """
+        self.name = name
+        self.width = width
+        self.height = height
+        self.size = size = width * height
+        self.storage = storage
+        self.obstacles = obstacles
+
+        self.walls = bytearray(size + 1)
+        self.walls[size] = 1
+        self.goals = bytearray(size + 1)
+        for x, y in obstacles:
+            self.walls[self.cell(x, y)] = 1
+        self.goal_mask = 0
+        for x, y in storage:
+            self.goals[self.cell(x, y)] = 1
+            self.goal_mask |= 1 << self.cell(x, y)
+        self.xy = [(c % width, c // width) for c in range(size)]
+        self.steps = tuple(tuple(self.cell(x + dx, y + dy) for x, y in self.xy) + (size,)
+                           for dx, dy in DIRECTIONS)
+
+        rng = random.Random(ZOBRIST_SEED)
+        self.box_keys = [rng.getrandbits(64) for _ in range(size + 1)]
+        self.robot_keys = [rng.getrandbits(64) for _ in range(size + 1)]
+
+        self.goal_cells = tuple(c for c in range(size) if self.goals[c])
+        self.push_distances = array('l')
+        for goal in self.goal_cells:
+            self.push_distances.extend(self._pull_distances(goal))
+        stride = size + 1
+        self.nearest_push = array('l', (min((self.push_distances[g * stride + c] for g in range(len(self.goal_cells))),
+                                            default=UNREACHABLE) for c in range(stride)))
+        self.nearest_manhattan = array('l', (min((abs(gx - x) + abs(gy - y) for gx, gy in storage), default=UNREACHABLE)
+                                             for x, y in self.xy))
+        self.nearest_manhattan.append(UNREACHABLE)
+        self.dead = bytearray(d == UNREACHABLE for d in self.nearest_push)
+        right, down, left, up = self.steps
+        self.tunnels = tuple(bytearray(not self.walls[c] and not self.goals[c] and self.walls[a[c]] and self.walls[b[c]]
+                                       for c in range(size + 1))
+                             for a, b in ((down, up), (right, left)))
+        self.memo = {}
+
+        # the rendering of the empty level, one character per cell and a newline after each row;
+        # cell c is at index c + c // width.
+        self.template = []
+        for c in range(size):
+            self.template.append(CHAR_WALL if self.walls[c] else CHAR_STORAGE if self.goals[c] else ' ')
+            if c % width == width - 1:
+                self.template.append('\n')
+
+    def cell(self, x, y):
+        """
+        Returns the cell index of position (x, y), or the off-grid cell if (x, y) is outside the puzzle.
+        """
+        if 0 <= x < self.width and 0 <= y < self.height:
+            return y * self.width + x
+        return self.size
+
+    def _pull_distances(self, goal):
+        """
+        Returns a cell-indexed array of push distances from every cell to the given storage point,
+        with UNREACHABLE for cells from which a box cannot reach it.
+
+        The distances are found by pulling a box backwards from the storage point in breadth-first
+        order: a box can have come from the next cell over if both that cell and the one behind it,
+        where the robot stood to push, are free of walls.
+        """
+        walls = self.walls
+        distances = array('l', [UNREACHABLE]) * (self.size + 1)
+        distances[goal] = 0
+        queue = [goal]
+        for box in queue:
+            for back in self.steps:
+                previous = back[box]
+                if distances[previous] == UNREACHABLE and not walls[previous] and not walls[back[previous]]:
+                    distances[previous] = distances[box] + 1
+                    queue.append(previous)
+        return distances
+
+    def __eq__(self, other):
+        if isinstance(other, Level):
+            return self is other or (self.width == other.width and self.walls == other.walls and
+                                     self.goals == other.goals)
+        return False
+
+    def __hash__(self):
+        return hash((self.width, bytes(self.walls), bytes(self.goals)))
+
+    def fingerprint(self):
+        """
+        Returns the SHA-1 hex digest of the wall and storage layout, which identifies the level
+        across runs, whatever its name.
+        """
+        return hashlib.sha1('{}x{}:'.format(self.width, self.height).encode() + bytes(self.walls) +
+                            bytes(self.goals)).hexdigest()
+
+
 class Board:
     """
     Represents the puzzle test_board1.txt.
+
+    A board only holds the dynamic part of a puzzle: a tuple with the cell of each robot,
+    a packed integer whose set bits are the box cells, and the Zobrist key of the two. Everything
+    else lives in the shared Level.
+
+    Robots are interchangeable: two boards whose robots stand on the same cells are equal, and
+    hash the same, whichever robot stands on which cell. The robot order is only kept so that
+    each robot keeps its letter along a solution.
     """
 
+    __slots__ = ('level', 'robot_cells', 'box_mask', 'key')
+
     def __init__(self, name: str, width: int, height: int, robots: object, boxes: object, storage: object,
                  obstacles: object) -> object:
         """
@@ -49,19 +229,84 @@ class Board:
         :type obstacles: List[tuple]
         :rtype: Board
         """
-        self.name = name
-        self.width = width
-        self.height = height
-        self.boxes = boxes
-        self.robots = robots
-        self.storage = storage
-        self.obstacles = obstacles
+        self.level = level = Level(name, width, height, storage, obstacles)
+
+        self.robot_cells = tuple(level.cell(x, y) for x, y in robots)
+        self.box_mask = 0
+        self.key = 0
+        for robot in self.robot_cells:
+            self.key ^= level.robot_keys[robot]
+        for x, y in boxes:
+            self.box_mask |= 1 << level.cell(x, y)
+            self.key ^= level.box_keys[level.cell(x, y)]
+
+    def derive(self, robot_cells, box_mask, key):
+        """
+        Returns a new board of the same level with the given robot cells and box mask.
+
+        :param robot_cells: the cell of each robot, in robot order.
+        :type robot_cells: tuple
+        :param box_mask: the packed set of box cells.
+        :type box_mask: int
+        :param key: the Zobrist key of the new board, updated incrementally by the caller.
+        :type key: int
+        :rtype: Board
+        """
+        board = Board.__new__(Board)
+        board.level = self.level
+        board.robot_cells = robot_cells
+        board.box_mask = box_mask
+        board.key = key
+        return board
+
+    @property
+    def name(self):
+        return self.level.name
+
+    @property
+    def width(self):
+        return self.level.width
+
+    @property
+    def height(self):
+        return self.level.height
+
+    @property
+    def storage(self):
+        return self.level.storage
+
+    @property
+    def obstacles(self):
+        return self.level.obstacles
+
+    @property
+    def robots(self):
+        """
+        The (x, y) position of each robot, in robot order.
+        """
+        return [self.level.xy[c] for c in self.robot_cells]
+
+    @property
+    def boxes(self):
+        """
+        The (x, y) position of each box.
+        """
+        return [self.level.xy[c] for c in iter_cells(self.box_mask)]
 
     def __hash__(self):
         '''
         Return a data item that can be used as a dictionary key to UNIQUELY represent a test_board1.txt.
         '''
-        return hash(self.__str__())
+        return self.key
+
+    def fingerprint(self):
+        """
+        Returns the SHA-1 hex digest of the level layout, the robot cells and the box cells, which
+        identifies the puzzle across runs, whatever its name. The robot cells are taken in robot
+        order, since a solution's move string refers to the robots by letter.
+        """
+        return hashlib.sha1('{}:{}:{}'.format(self.level.fingerprint(), self.robot_cells,
+                                              self.box_mask).encode()).hexdigest()
 
     def display(self):
         print(self.__str__())
@@ -70,47 +315,33 @@ class Board:
         '''
         Returns a string representation of a state that can be printed to stdout.
         '''
-        map = []
-        for y in range(0, self.height):
-            row = []
-            for x in range(0, self.width):
-                row += [' ']
-            map += [row]
-
-        # storage points are represented by dots.
-        for storage_point in self.storage:
-            map[storage_point[1]][storage_point[0]] = CHAR_STORAGE
-
-        # walls are represented by #.
-        for obstacle in self.obstacles:
-            map[obstacle[1]][obstacle[0]] = CHAR_WALL
+        level = self.level
+        width = level.width
+        # walls and storage points come from the level.
+        map = level.template[:]
 
         # robots are represented by A
-        for i, robot in enumerate(self.robots):
-            if robot in self.storage:
-                map[robot[1]][robot[0]] = chr(ord(CHAR_ROBOT_IN_STORAGE) + i)
+        for i, robot in enumerate(self.robot_cells):
+            if level.goals[robot]:
+                map[robot + robot // width] = chr(ord(CHAR_ROBOT_IN_STORAGE) + i)
             else:
-                map[robot[1]][robot[0]] = chr(ord(CHAR_ROBOT) + i)
+                map[robot + robot // width] = chr(ord(CHAR_ROBOT) + i)
 
         # boxes are represented by ? or * if they are at storage points.
-        for box in self.boxes:
-            if box in self.storage:
-                map[box[1]][box[0]] = CHAR_BOX_IN_STORAGE
+        for box in iter_cells(self.box_mask):
+            if level.goals[box]:
+                map[box + box // width] = CHAR_BOX_IN_STORAGE
             else:
-                map[box[1]][box[0]] = CHAR_BOX
-
-        s = ''
-        for row in map:
-            for char in row:
-                s += char
-            s += '\n'
+                map[box + box // width] = CHAR_BOX
 
-        return s
+        return ''.join(map)
 
     # customized eq for object comparison.
     def __eq__(self, other):
         if isinstance(other, Board):
-            return self.__str__() == other.__str__()
+            return self.key == other.key and self.box_mask == other.box_mask and \
+                (self.robot_cells == other.robot_cells or sorted(self.robot_cells) == sorted(other.robot_cells)) and \
+                self.level == other.level
         return False
 
 
@@ -122,6 +353,8 @@ class State:
     heuristic function, f value, current depth and parent.
     """
 
+    __slots__ = ('board', 'parent', 'hfn', 'f', 'depth', 'id')
+
     def __init__(self, board: Board, hfn, f: int, depth: int, parent=None):
         """
         :param board: The test_board1.txt of the state.
@@ -172,42 +405,62 @@ def read_from_file(filename: str) -> Board:
     """
 
     puzzle_file = open(filename, "r")
+    board = read_from_lines(puzzle_file)
+    puzzle_file.close()
+    return board
+
+
+def read_from_lines(lines) -> Board:
+    """
+    Reads in a puzzle from its lines, in the format of a puzzle file,
+    and returns a Board
+
+    :param lines: The lines of the puzzle: its name, width, height and rows.
+    :type lines: Iterable[str]
+    :return: the loaded Board
+    :rtype: Board
+    """
+
     counter = 0
     width = -1
     height = -1
     name = ""
 
     row = 0
-    board = Board("", -1, -1, [], [], [], [])
+    robots = []
+    boxes = []
+    storage = []
+    obstacles = []
 
-    for line in puzzle_file:
+    for line in lines:
 
         if counter == 0: # first line has name of puzzle
-            board.name = line.strip()
+            name = line.strip()
         elif counter == 1: # second line has width
-            board.width = int(line)
+            width = int(line)
         elif counter == 2: # third line has height
-            board.height = int(line)
-        else: # the following lines describe cars
-            for col in range(len(line)):
+            height = int(line)
+        elif row < height: # the following lines describe cars
+            for col in range(min(len(line), width)):
                 char = line[col]
                 if char == CHAR_WALL:
-                    board.obstacles.append((col, row))
+                    obstacles.append((col, row))
                 elif char == CHAR_BOX_IN_STORAGE:
-                    board.boxes.append((col, row))
-                    board.storage.append((col, row))
+                    boxes.append((col, row))
+                    storage.append((col, row))
                 elif char == CHAR_BOX:
-                    board.boxes.append((col, row))
+                    boxes.append((col, row))
                 elif char == CHAR_STORAGE:
-                    board.storage.append((col, row))
+                    storage.append((col, row))
                 elif char.isalpha() and char.isupper():
-                    board.robots.append((col, row))
-                    board.storage.append((col, row))
+                    robots.append((char.lower(), (col, row)))
+                    storage.append((col, row))
                 elif char.isalpha() and char.islower():
-                    board.robots.append((col, row))
+                    robots.append((char, (col, row)))
             row += 1
 
         counter += 1
 
-    puzzle_file.close()
-    return board
\ No newline at end of file
+    # robots are numbered by their letters, as __str__ draws them.
+    robots = [cell for char, cell in sorted(robots)]
+    return Board(name, width, height, robots, boxes, storage, obstacles)
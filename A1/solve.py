@@ -6,11 +6,30 @@
 
 from typing import List
 import heapq
-from heapq import heappush, heappop
+from heapq import heappush, heappop, heapify
 import time
 import argparse
+from array import array
+from collections import deque, OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from itertools import combinations, islice
+import csv
+import glob
+import json
+import multiprocessing
+import os
+import queue
+import random
+import signal
+import sqlite3
+import traceback
 import math  # for infinity
 
+try:
+    import resource
+except ImportError:  # not available on Windows; memory is then neither limited nor measured
+    resource = None
+
 from board import *
 
 
@@ -23,10 +42,7 @@ def is_goal(state):
     :return: True or False
     :rtype: bool
     """
-    for box in state.board.boxes:
-        if box not in state.board.storage:
-            return False
-    return True
+    return state.board.box_mask & ~state.board.level.goal_mask == 0
 
 
 def get_path(state):
@@ -60,56 +76,839 @@ def check_valid_move(board, robot, direction):
     robot: Tuple
     direction: Tuple (e.g. (1, 0) or (0, -1))
     """
-    new_pos = add_tuples(robot, direction)
-    if new_pos in board.obstacles or new_pos in board.robots:
+    level = board.level
+    step = level.steps[DIRECTIONS.index(direction)]
+    new_pos = step[level.cell(*robot)]
+    if level.walls[new_pos] or new_pos in board.robot_cells:
         return False
-    elif new_pos in board.boxes:
-        new_pos_2 = add_tuples(new_pos, direction)
-        if new_pos_2 in board.obstacles or new_pos_2 in board.robots or new_pos_2 in board.boxes:
+    elif board.box_mask >> new_pos & 1:
+        new_pos_2 = step[new_pos]
+        if level.walls[new_pos_2] or new_pos_2 in board.robot_cells or board.box_mask >> new_pos_2 & 1:
             return False
     return True
 
 
-def get_successors(state):
+def is_deadlocked(level, box_mask, box):
+    """
+    Returns True if the box just pushed onto cell `box` can never be moved again while some
+    box that it is stuck with is off storage.
+
+    Two patterns are checked, both local to the pushed box:
+    - a 2x2 square containing the box that is filled with walls and boxes, and
+    - a frozen group: a box is frozen when it is blocked along both axes, where an axis is
+      blocked by a wall on either side, by dead cells on both sides, or by a neighbouring box
+      that is itself frozen (the boxes already being checked count as walls).
+
+    :param level: The level of the board.
+    :type level: Level
+    :param box_mask: The packed set of box cells after the push.
+    :type box_mask: int
+    :param box: The cell the box was pushed onto.
+    :type box: int
+    :return: True or False
+    :rtype: bool
+    """
+    walls = level.walls
+    right, down, left, up = level.steps
+
+    # 2x2 squares: the box together with one horizontal, one vertical and one diagonal neighbour.
+    for horizontal in (right, left):
+        for vertical in (down, up):
+            square = (box, horizontal[box], vertical[box], vertical[horizontal[box]])
+            if all(walls[c] or box_mask >> c & 1 for c in square) and \
+                    any(box_mask >> c & 1 and not level.goals[c] for c in square):
+                return True
+
+    frozen = []
+    if not _is_frozen(level, box_mask, box, set(), frozen):
+        return False
+    return any(not level.goals[c] for c in frozen)
+
+
+def _is_frozen(level, box_mask, box, fixed, frozen):
+    """
+    Returns True if the box on cell `box` is blocked along both axes, treating the boxes in
+    `fixed` as walls. Every box found frozen on the way is appended to `frozen`.
+    """
+    walls = level.walls
+    dead = level.dead
+    right, down, left, up = level.steps
+    fixed.add(box)
+    mark = len(frozen)
+
+    for forward, backward in ((right, left), (down, up)):
+        a, b = forward[box], backward[box]
+        if walls[a] or walls[b] or a in fixed or b in fixed:
+            continue
+        if dead[a] and dead[b]:
+            continue
+        if box_mask >> a & 1 and _is_frozen(level, box_mask, a, fixed, frozen):
+            continue
+        if box_mask >> b & 1 and _is_frozen(level, box_mask, b, fixed, frozen):
+            continue
+        # the box can still move along this axis, and so can any neighbour found frozen on its account.
+        for c in frozen[mark:]:
+            fixed.discard(c)
+        fixed.discard(box)
+        del frozen[mark:]
+        return False
+
+    frozen.append(box)
+    return True
+
+
+class SearchStats:
+    """
+    Counters a search fills in when it is given a SearchStats:
+
+    - expanded, generated: the number of states expanded and of successor states generated.
+    - duplicates: the successors dropped because their board was already reached as cheaply.
+    - deadlocks: the moves and successors pruned as deadlocked, whether by the dead cells,
+      the freeze and 2x2 checks, or an infinite heuristic value.
+    - reduced: the moves skipped by the partial-order reduction of get_successors.
+    - macro_moves: the successors generated as tunnel or goal-room macro moves, in place of
+      a single push.
+    - peak_frontier, peak_closed: the largest sizes of the frontier and of the set of
+      boards the search remembers (for A*, every board reached so far).
+    - heuristic_time, successor_time: the seconds spent computing heuristic values and
+      generating successors otherwise.
+    - heuristic_hits, heuristic_misses: the successors whose heuristic values were, and were
+      not, found in the cache of heuristic_values.
+    """
+
+    __slots__ = ('expanded', 'generated', 'duplicates', 'deadlocks', 'reduced', 'macro_moves', 'peak_frontier',
+                 'peak_closed', 'heuristic_time', 'successor_time', 'heuristic_hits', 'heuristic_misses')
+
+    def __init__(self):
+        self.expanded = 0
+        self.generated = 0
+        self.duplicates = 0
+        self.deadlocks = 0
+        self.reduced = 0
+        self.macro_moves = 0
+        self.peak_frontier = 0
+        self.peak_closed = 0
+        self.heuristic_time = 0.0
+        self.successor_time = 0.0
+        self.heuristic_hits = 0
+        self.heuristic_misses = 0
+
+    def record(self, frontier_size, closed_size):
+        """
+        Update the peak frontier and closed set sizes.
+        """
+        if frontier_size > self.peak_frontier:
+            self.peak_frontier = frontier_size
+        if closed_size > self.peak_closed:
+            self.peak_closed = closed_size
+
+    def merge(self, counters):
+        """
+        Add the counters of another search, as given by as_dict, to these ones.
+        The peaks are added up too, as the searches are assumed to run side by side.
+        """
+        for name in self.__slots__:
+            setattr(self, name, getattr(self, name) + counters[name])
+
+    def as_dict(self):
+        """
+        Return the counters as a dict, ready to be saved as JSON, with the hit rate of the
+        heuristic cache.
+        """
+        counters = {name: getattr(self, name) for name in self.__slots__}
+        lookups = self.heuristic_hits + self.heuristic_misses
+        counters['heuristic_hit_rate'] = self.heuristic_hits / lookups if lookups else 0.0
+        return counters
+
+
+def get_successors(state, stats=None, reduce=True, macros=False):
     """
     Return a list containing the successor states of the given state.
     The states in the list may be in any arbitrary order.
 
+    With several robots, moves that commute are only tried in one order (partial-order
+    reduction): two moves are independent if the cells they touch (the robot's cell, the cell
+    it steps to, and the cell a pushed box goes to) are disjoint, and then a move is skipped
+    if it comes right after an independent move from a higher robot cell, since making it
+    first leads to the same board at the same cost. This keeps the cheapest cost to
+    every board for A*, BFS and IDA*, but a search that keeps the first path it finds to
+    a board, such as DFS, should pass reduce=False.
+
+    With macros=True, on a board with a single robot, a push is replaced by a macro move
+    where stopping after it is useless (see macro_walk): a push along a tunnel carries on to
+    the end of the tunnel, and a push onto the entrance of a goal room carries on to a storage
+    point in the room. The depth of a macro move counts every move, with a parent chain through
+    the boards on the way, so the path stays one move per step; this is also why BFS orders
+    its queue by depth when it takes macro moves. Macro moves turn the partial-order reduction
+    off, and are not taken on boards with several robots, where another robot may need the
+    box to stop.
+
     :param state: The current state.
     :type state: State
+    :param stats: The counters to update, if any.
+    :type stats: Optional[SearchStats]
+    :param reduce: Whether to skip the moves the partial-order reduction allows.
+    :type reduce: bool
+    :param macros: Whether to replace pushes by tunnel and goal-room macro moves.
+    :type macros: bool
     :return: The list of successor states.
     :rtype: List[State]
     """
 
+    board = state.board
+    level = board.level
+    walls = level.walls
+    dead = level.dead
+    robot_cells = board.robot_cells
+    box_mask = board.box_mask
+    box_keys = level.box_keys
+    macros = macros and len(robot_cells) == 1
+    time_start = time.perf_counter()
+
+    # the cells touched by the last move, and the cell its robot came from.
+    last = ()
+    last_source = -1
+    if reduce and not macros and len(robot_cells) > 1 and state.parent is not None:
+        parent_board = state.parent.board
+        for old_pos, new_pos in zip(parent_board.robot_cells, robot_cells):
+            if old_pos != new_pos:
+                last = (old_pos, new_pos, (box_mask & ~parent_board.box_mask).bit_length() - 1)
+                last_source = old_pos
+                break
+
+    boards = []
+    pushes = []
+    chains = []
+    pruned = 0
+    reduced = 0
+    robot_keys = level.robot_keys
+    for i, robot in enumerate(robot_cells):
+        independent = robot < last_source and robot not in last
+        for direction, step in enumerate(level.steps):
+            new_pos = step[robot]
+            if walls[new_pos] or new_pos in robot_cells:
+                continue
+            new_box_mask = box_mask
+            new_key = board.key ^ robot_keys[robot] ^ robot_keys[new_pos]
+            push = None
+            if box_mask >> new_pos & 1:
+                new_pos_2 = step[new_pos]
+                if walls[new_pos_2] or new_pos_2 in robot_cells or box_mask >> new_pos_2 & 1:
+                    continue
+                if independent and new_pos not in last and new_pos_2 not in last:
+                    reduced += 1
+                    continue
+                new_box_mask = box_mask ^ (1 << new_pos) ^ (1 << new_pos_2)
+                if dead[new_pos_2] or is_deadlocked(level, new_box_mask, new_pos_2):
+                    pruned += 1
+                    continue
+                new_key ^= box_keys[new_pos] ^ box_keys[new_pos_2]
+                push = (new_pos, new_pos_2)
+            elif independent and new_pos not in last:
+                reduced += 1
+                continue
+
+            new_board = board.derive(robot_cells[:i] + (new_pos,) + robot_cells[i + 1:], new_box_mask, new_key)
+            walk = macro_walk(level, new_box_mask, new_pos, direction) if macros and push is not None else None
+            if walk:
+                # replay the walk; the robot pushes the box whenever it steps onto it.
+                chain = [new_board]
+                box = new_pos_2
+                for cell in walk:
+                    new_robot = chain[-1].robot_cells[0]
+                    new_key = chain[-1].key ^ robot_keys[new_robot] ^ robot_keys[cell]
+                    if cell == box:
+                        box = 2 * cell - new_robot
+                        new_box_mask ^= (1 << cell) ^ (1 << box)
+                        new_key ^= box_keys[cell] ^ box_keys[box]
+                    chain.append(board.derive((cell,), new_box_mask, new_key))
+                new_board = chain.pop()
+                push = (new_pos, box)
+            else:
+                chain = None
+            boards.append(new_board)
+            pushes.append(push)
+            chains.append(chain)
+
+    time_heuristic = time.perf_counter()
+    values = _successor_values(state, boards, pushes, stats)
+    time_end = time.perf_counter()
+
     output = []
-    for robot in state.board.robots:
-        for direction in {(1, 0), (0, 1), (-1, 0), (0, -1)}:
-            if check_valid_move(state.board, robot, direction):
-                new_board = Board(state.board.name, state.board.width, state.board.height, [], [], state.board.storage,
-                                  state.board.obstacles)
-
-                for rbt in state.board.robots:
-                    if rbt != robot:
-                        new_board.robots.append(rbt)
-                    else:
-                        new_board.robots.append(add_tuples(rbt, direction))
+    macro_moves = 0
+    for new_board, h, chain in zip(boards, values, chains):
+        parent = state
+        if chain is not None:
+            macro_moves += 1
+            # the boards inside a macro move are never searched; their states only link the path.
+            for middle in chain:
+                parent = State(middle, state.hfn, h + parent.depth + 1, parent.depth + 1, parent)
+        output.append(State(new_board, state.hfn, h + parent.depth + 1, parent.depth + 1, parent))
+
+    if stats is not None:
+        stats.expanded += 1
+        stats.generated += len(output)
+        stats.deadlocks += pruned
+        stats.reduced += reduced
+        stats.macro_moves += macro_moves
+        stats.heuristic_time += time_end - time_heuristic
+        stats.successor_time += time_heuristic - time_start + time.perf_counter() - time_end
+    return output
 
-                for box in state.board.boxes:
-                    if box != (add_tuples(robot, direction)):
-                        new_board.boxes.append(box)
-                    else:
-                        new_board.boxes.append(add_tuples(box, direction))
 
-                new_state = State(new_board, state.hfn, state.hfn(new_board) + state.depth + 1, state.depth + 1, state)
-                output.append(new_state)
+def _successor_values(state, boards, pushes, stats):
+    """
+    Returns the heuristic values of the successors of a state, given the (old cell, new cell)
+    of the box each one pushed, or None. A heuristic of the boxes alone keeps the parent's
+    value for the successors that only move a robot, and a heuristic with an `update`
+    function derives the value of a push from the parent's; the rest go to heuristic_values.
+    """
+    hfn = state.hfn
+    h = state.f - state.depth
+    update = getattr(hfn, 'update', None)
+    box_only = not getattr(hfn, 'uses_robots', True)
+    if h == math.inf or (update is None and not box_only):
+        return heuristic_values(hfn, boards, stats)
+
+    values = []
+    rest = []
+    for i, (new_board, push) in enumerate(zip(boards, pushes)):
+        if push is None:
+            if box_only:
+                values.append(h)
+                continue
+        elif update is not None:
+            values.append(update(new_board, h, push[0], push[1]))
+            continue
+        values.append(None)
+        rest.append(i)
+    if rest:
+        for i, value in zip(rest, heuristic_values(hfn, [boards[i] for i in rest], stats)):
+            values[i] = value
+    return values
+
+
+def goal_rooms(level):
+    """
+    Returns the goal rooms of the level, found once and kept in its memo.
+
+    A goal room is a region of at least half storage points whose only access from the rest
+    of the level is a tunnel cell, its entrance. It is recorded under the entrance
+    and the direction a box is pushed in to enter it, as a pair of the packed set of its cells
+    and its storage points in the order to fill them: farthest from the entrance first, so that
+    the boxes already in the room leave the way to the next ones open.
+
+    :param level: The level of the board.
+    :type level: Level
+    :return: The goal rooms by (entrance cell, direction).
+    :rtype: dict
+    """
+    rooms = level.memo.get('goal_rooms')
+    if rooms is not None:
+        return rooms
+
+    rooms = {}
+    walls = level.walls
+    stride = level.size + 1
+    for direction, step in enumerate(level.steps):
+        back = level.steps[(direction + 2) % 4]
+        tunnels = level.tunnels[direction % 2]
+        for entrance in range(level.size):
+            if not tunnels[entrance] or walls[step[entrance]] or walls[back[entrance]]:
+                continue
+            # the cells reached from past the entrance without crossing it.
+            cells = [step[entrance]]
+            seen = {entrance, step[entrance]}
+            for cell in cells:
+                for other_step in level.steps:
+                    neighbour = other_step[cell]
+                    if neighbour not in seen and not walls[neighbour]:
+                        seen.add(neighbour)
+                        cells.append(neighbour)
+            if back[entrance] in seen:
+                continue
+            distances = {}
+            for g, goal in enumerate(level.goal_cells):
+                if goal in seen and level.push_distances[g * stride + entrance] != UNREACHABLE:
+                    distances[goal] = level.push_distances[g * stride + entrance]
+            if not distances or 2 * len(distances) < len(cells):
+                continue
+            room_mask = 0
+            for cell in cells:
+                room_mask |= 1 << cell
+            rooms[(entrance, direction)] = (room_mask, tuple(sorted(distances, key=lambda goal: -distances[goal])))
+
+    level.memo['goal_rooms'] = rooms
+    return rooms
+
+
+def macro_walk(level, box_mask, robot, direction):
+    """
+    Returns the cells the single robot of a board walks through to carry on its push as a
+    macro move, or an empty list if there is none. get_successors takes the macro move in
+    place of the push itself, so it is only made where stopping after the push is useless.
+
+    While the robot and the box are both on tunnel cells along the push (walls on both sides,
+    and no storage point), the box can only leave the tunnel forwards, pushed by the robot
+    behind it, so it is pushed on as long as the cell past it is free and not a deadlock. If
+    the box is on the entrance of a goal room (see goal_rooms), which is the only access to
+    the room, and no box off storage is inside, it is taken to the first free storage point
+    of the room, in fill order, that it can reach, along the fewest moves.
+
+    :param level: The level of the board.
+    :type level: Level
+    :param box_mask: The packed set of box cells after the push.
+    :type box_mask: int
+    :param robot: The cell of the robot after the push.
+    :type robot: int
+    :param direction: The index in DIRECTIONS of the push.
+    :type direction: int
+    :return: The cells the robot steps onto, in order.
+    :rtype: List[int]
+    """
+    walls = level.walls
+    dead = level.dead
+    step = level.steps[direction]
+    tunnels = level.tunnels[direction % 2]
+    rooms = goal_rooms(level)
+    box = step[robot]
+    walk = []
+    while True:
+        room = rooms.get((box, direction))
+        if room is not None:
+            rest = _room_walk(level, box_mask, robot, box, room)
+            if rest:
+                return walk + rest
+        if not tunnels[robot] or not tunnels[box]:
+            return walk
+        next_cell = step[box]
+        if walls[next_cell] or box_mask >> next_cell & 1 or dead[next_cell]:
+            return walk
+        new_box_mask = box_mask ^ (1 << box) ^ (1 << next_cell)
+        if is_deadlocked(level, new_box_mask, next_cell):
+            return walk
+        walk.append(box)
+        robot, box, box_mask = box, next_cell, new_box_mask
+
+
+def _room_walk(level, box_mask, robot, box, room):
+    """
+    Returns the fewest cells the robot on cell `robot` walks through to push the box on the
+    entrance cell `box` to a free storage point of the goal room, preferring the storage
+    points earlier in fill order, or an empty list if it cannot reach any.
+    """
+    room_mask, storage = room
+    if box_mask & room_mask & ~level.goal_mask:
+        return []
+    rank = {goal: i for i, goal in enumerate(storage) if not box_mask >> goal & 1}
+    if not rank:
+        return []
+
+    walls = level.walls
+    dead = level.dead
+    blocked = box_mask ^ (1 << box)
+    start = (robot, box)
+    parents = {start: None}
+    queue = [start]
+    best = None
+    for current in queue:
+        robot, box = current
+        if box in rank and (best is None or rank[box] < rank[best[1]]):
+            best = current
+            if rank[box] == 0:
+                break
+        for step in level.steps:
+            new_robot = step[robot]
+            if walls[new_robot] or blocked >> new_robot & 1:
+                continue
+            new_box = box
+            if new_robot == box:
+                new_box = step[box]
+                if not room_mask >> new_box & 1 or blocked >> new_box & 1 or dead[new_box]:
+                    continue
+            if (new_robot, new_box) not in parents:
+                parents[(new_robot, new_box)] = current
+                queue.append((new_robot, new_box))
+
+    walk = []
+    while best is not None and best != start:
+        walk.append(best[0])
+        best = parents[best]
+    walk.reverse()
+    return walk
+
+
+def move_robot(state, robot, direction):
+    """
+    Return the successor of the given state in which one robot takes a single step,
+    pushing the box in front of it if there is one. The move is assumed to be valid.
 
-    return output
+    :param state: The current state.
+    :type state: State
+    :param robot: The index of the robot that moves.
+    :type robot: int
+    :param direction: The index of the direction in DIRECTIONS.
+    :type direction: int
+    :return: The successor state.
+    :rtype: State
+    """
+    new_board = apply_move(state.board, robot, direction)
+    return State(new_board, state.hfn, state.hfn(new_board) + state.depth + 1, state.depth + 1, state)
+
+
+def apply_move(board, robot, direction):
+    """
+    Return the board after one robot takes a single step, pushing the box in front of it
+    if there is one. The move is assumed to be valid.
+
+    :param board: The current board.
+    :type board: Board
+    :param robot: The index of the robot that moves.
+    :type robot: int
+    :param direction: The index of the direction in DIRECTIONS.
+    :type direction: int
+    :rtype: Board
+    """
+    level = board.level
+    step = level.steps[direction]
+    old_pos = board.robot_cells[robot]
+    new_pos = step[old_pos]
+    robot_keys = level.robot_keys
+    box_mask = board.box_mask
+    key = board.key ^ robot_keys[old_pos] ^ robot_keys[new_pos]
+    if box_mask >> new_pos & 1:
+        new_pos_2 = step[new_pos]
+        box_mask ^= (1 << new_pos) ^ (1 << new_pos_2)
+        key ^= level.box_keys[new_pos] ^ level.box_keys[new_pos_2]
+    return board.derive(board.robot_cells[:robot] + (new_pos,) + board.robot_cells[robot + 1:], box_mask, key)
+
+
+def flood_fill(level, box_mask, robot_cells, start):
+    """
+    Return every cell a robot standing on `start` can walk to without pushing a box.
+
+    :param level: The level of the board.
+    :type level: Level
+    :param box_mask: The packed set of box cells.
+    :type box_mask: int
+    :param robot_cells: The cells of all robots, which the walking robot cannot pass through.
+    :type robot_cells: tuple
+    :param start: The cell of the walking robot.
+    :type start: int
+    :return: a dict mapping each reachable cell to (distance, previous cell, direction of the last step).
+    :rtype: Dict[int, tuple]
+    """
+    walls = level.walls
+    reached = {start: (0, None, None)}
+    queue = [start]
+    for cell in queue:
+        distance = reached[cell][0] + 1
+        for direction, step in enumerate(level.steps):
+            new_pos = step[cell]
+            if new_pos not in reached and not walls[new_pos] and not box_mask >> new_pos & 1 and \
+                    new_pos not in robot_cells:
+                reached[new_pos] = (distance, cell, direction)
+                queue.append(new_pos)
+    return reached
+
+
+def walk_path(reached, target):
+    """
+    Return the directions of the steps leading to `target` in the result of flood_fill.
+    """
+    directions = []
+    _, previous, direction = reached[target]
+    while previous is not None:
+        directions.append(direction)
+        _, previous, direction = reached[previous]
+    directions.reverse()
+    return directions
+
+
+def expand_pushes(init_board, hfn, pushes):
+    """
+    Replay a sequence of pushes from the initial board one step at a time, walking
+    the robot to each pushing position along a shortest path.
+
+    :param init_board: The initial board.
+    :type init_board: Board
+    :param hfn: The heuristic function of the states on the path.
+    :type hfn: Heuristic
+    :param pushes: (robot index, cell the robot pushes from, direction of the push) for every push, in order.
+    :type pushes: List[tuple]
+    :return: The path of states from the initial state.
+    :rtype: List[State]
+    """
+    state = State(init_board, hfn, hfn(init_board), 0, None)
+    for robot, cell, direction in pushes:
+        board = state.board
+        reached = flood_fill(board.level, board.box_mask, board.robot_cells, board.robot_cells[robot])
+        for step in walk_path(reached, cell):
+            state = move_robot(state, robot, step)
+        state = move_robot(state, robot, direction)
+    return get_path(state)
 
 
-def dfs(init_board):
+def push_moves(level, box_mask, reached):
+    """
+    Generate every push available to a robot that can walk to the cells in `reached`,
+    skipping pushes onto dead cells and pushes that cause a deadlock.
+
+    :param level: The level of the board.
+    :type level: Level
+    :param box_mask: The packed set of box cells.
+    :type box_mask: int
+    :param reached: The result of flood_fill for the robot.
+    :type reached: Dict[int, tuple]
+    :return: (cell pushed from, direction, new box mask, new robot cell, walking distance) for each push.
+    """
+    dead = level.dead
+    for cell, (distance, _, _) in reached.items():
+        for direction, step in enumerate(level.steps):
+            box = step[cell]
+            if not box_mask >> box & 1:
+                continue
+            new_pos = step[box]
+            if dead[new_pos] or box_mask >> new_pos & 1:
+                continue
+            new_box_mask = box_mask ^ (1 << box) ^ (1 << new_pos)
+            if not is_deadlocked(level, new_box_mask, new_pos):
+                yield cell, direction, new_box_mask, box, distance
+
+
+def pull_moves(level, box_mask, reached):
+    """
+    Generate every pull available to a robot that can walk to the cells in `reached`:
+    the robot stands next to a box and steps away from it, dragging the box along.
+    Each pull is the reverse of the push from the robot's new cell in the same direction.
+
+    :param level: The level of the board.
+    :type level: Level
+    :param box_mask: The packed set of box cells.
+    :type box_mask: int
+    :param reached: The result of flood_fill for the robot.
+    :type reached: Dict[int, tuple]
+    :return: (cell pulled to, direction of the reverse push, new box mask, new robot cell, walking distance)
+             for each pull.
+    """
+    walls = level.walls
+    steps = level.steps
+    for cell, (distance, _, _) in reached.items():
+        for direction, step in enumerate(steps):
+            box = step[cell]
+            if not box_mask >> box & 1:
+                continue
+            new_pos = steps[(direction + 2) % 4][cell]
+            if walls[new_pos] or box_mask >> new_pos & 1:
+                continue
+            yield new_pos, direction, box_mask ^ (1 << box) ^ (1 << cell), new_pos, distance
+
+
+def a_star_pushes(init_board, hfn, stats=None):
+    """
+    Run the A_star search algorithm over box pushes given an initial board and a heuristic function.
+
+    A node is a box configuration together with the region the robot can walk to, identified
+    by its smallest cell, so positions that differ only in where the robot stands inside the
+    region are expanded once. Each successor is a single push, costing the walk to the pushing
+    position plus the push itself. The solution is expanded back into single steps, so the path
+    and cost returned mean the same as for a_star, although the cost is not guaranteed to be
+    the smallest one.
+
+    Only puzzles with one robot are searched by pushes, since several robots can block each
+    other's walks; any other puzzle falls back to a_star.
+
+    :param init_board: The initial starting board.
+    :type init_board: Board
+    :param hfn: The heuristic function.
+    :type hfn: Heuristic (a function that consumes a Board and produces a numeric heuristic value)
+    :param stats: The counters to update, if any.
+    :type stats: Optional[SearchStats]
+    :return: (the path to goal state, solution cost)
+    :rtype: List[State], int
+    """
+    if len(init_board.robot_cells) != 1:
+        return a_star(init_board, hfn, stats=stats)
+
+    level = init_board.level
+    steps = level.steps
+    box_keys = level.box_keys
+    robot_keys = level.robot_keys
+
+    # a node is (box mask, robot cell, Zobrist key of the boxes, cost, parent node, push).
+    robot = init_board.robot_cells[0]
+    root = (init_board.box_mask, robot, init_board.key ^ robot_keys[robot], 0, None, None)
+    frontier = [(hfn(init_board), 0, root)]
+    best_cost = {(init_board.box_mask, robot): 0}
+    closed = set()
+    counter = 1
+
+    while len(frontier) != 0:
+        node = heappop(frontier)[-1]
+        box_mask, robot, box_key, cost, parent, push = node
+        reached = flood_fill(level, box_mask, (), robot)
+        region = (box_mask, min(reached))
+        if region in closed:
+            continue
+        closed.add(region)
+        if stats is not None:
+            stats.expanded += 1
+
+        if box_mask & ~level.goal_mask == 0:
+            pushes = []
+            while node[4] is not None:
+                pushes.append((0,) + node[5])
+                node = node[4]
+            pushes.reverse()
+            return expand_pushes(init_board, hfn, pushes), cost
+
+        for cell, direction, new_box_mask, box, distance in push_moves(level, box_mask, reached):
+            new_cost = cost + distance + 1
+            if best_cost.get((new_box_mask, box), math.inf) <= new_cost:
+                continue
+            best_cost[(new_box_mask, box)] = new_cost
+
+            new_pos = steps[direction][box]
+            new_box_key = box_key ^ box_keys[box] ^ box_keys[new_pos]
+            h = hfn(init_board.derive((box,), new_box_mask, new_box_key ^ robot_keys[box]))
+            if h == math.inf:
+                continue
+            child = (new_box_mask, box, new_box_key, new_cost, node, (cell, direction))
+            heappush(frontier, (new_cost + h, counter, child))
+            counter += 1
+            if stats is not None:
+                stats.generated += 1
+    return [], -1
+
+
+# Largest number of ways of filling the storage points with the boxes that the backward search
+# of bidirectional starts from.
+BIDIRECTIONAL_GOAL_LAYOUTS = 64
+
+
+def bidirectional(init_board, hfn, stats=None):
+    """
+    Run a bidirectional breadth-first search over box pushes given an initial board.
+
+    The forward search pushes boxes from the initial board; the backward search pulls boxes
+    away from the ways of filling storage points with them, with the robot ending in any
+    region it could walk to. There are C(storage points, boxes) such layouts, which grows
+    exponentially, so the backward search only starts from the first BIDIRECTIONAL_GOAL_LAYOUTS
+    of them; the forward search recognises any goal layout by itself, so no solution is lost,
+    but the two searches may then meet later. Nodes on both sides are keyed the way a_star_pushes keys them,
+    by the box configuration and the smallest cell of the robot's region, so a node found by
+    both searches joins a path of pushes to the start with a path of pushes to a goal. The
+    side with the smaller layer is expanded next. The pushes are then replayed step by step,
+    so the path and cost returned mean the same as for a_star, although the cost is not
+    guaranteed to be the smallest one.
+
+    Only puzzles with one robot are searched this way; any other puzzle falls back to a_star.
+
+    :param init_board: The initial starting board.
+    :type init_board: Board
+    :param hfn: The heuristic function of the states on the returned path.
+    :type hfn: Heuristic
+    :param stats: The counters to update, if any.
+    :type stats: Optional[SearchStats]
+    :return: (the path to goal state, solution cost)
+    :rtype: List[State], int
+    """
+    if len(init_board.robot_cells) != 1:
+        return a_star(init_board, hfn, stats=stats)
+
+    level = init_board.level
+    robot = init_board.robot_cells[0]
+
+    # both maps take a node key to (the key of the next node toward the start or the goal,
+    # the push between the two nodes as (cell pushed from, direction)), or None for a root.
+    start = (init_board.box_mask, min(flood_fill(level, init_board.box_mask, (), robot)))
+    forward = {start: None}
+    forward_layer = [(init_board.box_mask, robot)]
+    backward = {}
+    backward_layer = []
+
+    playable = flood_fill(level, 0, (), robot)
+    layouts = combinations(level.goal_cells, bin(init_board.box_mask).count('1'))
+    for goal_cells in islice(layouts, BIDIRECTIONAL_GOAL_LAYOUTS):
+        box_mask = 0
+        for cell in goal_cells:
+            box_mask |= 1 << cell
+        covered = set()
+        for cell in playable:
+            if cell not in covered and not box_mask >> cell & 1:
+                region = flood_fill(level, box_mask, (), cell)
+                covered.update(region)
+                backward[(box_mask, min(region))] = None
+                backward_layer.append((box_mask, cell))
+
+    # with every layout seeded, a backward search that runs out of nodes proves there is no solution.
+    complete = next(layouts, None) is None
+    if init_board.box_mask & ~level.goal_mask == 0:
+        backward.setdefault(start, None)
+    meet = start if start in backward else None
+    while meet is None and len(forward_layer) != 0 and (len(backward_layer) != 0 or not complete):
+        if len(backward_layer) == 0 or len(forward_layer) <= len(backward_layer):
+            forward_layer, meet = _search_layer(level, forward_layer, forward, backward, push_moves, True,
+                                                 stats)
+        else:
+            backward_layer, meet = _search_layer(level, backward_layer, backward, forward, pull_moves,
+                                                   False, stats)
+    if meet is None:
+        return [], -1
+
+    pushes = []
+    key = meet
+    while forward[key] is not None:
+        key, push = forward[key]
+        pushes.append((0,) + push)
+    pushes.reverse()
+    key = meet
+    while backward[key] is not None:
+        key, push = backward[key]
+        pushes.append((0,) + push)
+
+    path = expand_pushes(init_board, hfn, pushes)
+    return path, path[-1].depth
+
+
+def _search_layer(level, layer, links, other_links, moves, forward, stats):
+    """
+    Expands one breadth-first layer of (box mask, robot cell) nodes for bidirectional,
+    recording new node keys in links. Returns the next layer and the key of a node found
+    in other_links, or None.
+    """
+    next_layer = []
+    for box_mask, robot in layer:
+        reached = flood_fill(level, box_mask, (), robot)
+        key = (box_mask, min(reached))
+        if stats is not None:
+            stats.expanded += 1
+        for cell, direction, new_box_mask, new_robot, _ in moves(level, box_mask, reached):
+            new_key = (new_box_mask, min(flood_fill(level, new_box_mask, (), new_robot)))
+            if new_key in links:
+                continue
+            # a goal layout the backward search did not start from still ends the search.
+            if forward and new_box_mask & ~level.goal_mask == 0:
+                other_links.setdefault(new_key, None)
+            # forward links point back toward the start, backward links toward a goal.
+            links[new_key] = (key, (cell, direction)) if forward else (key, (new_robot, direction))
+            next_layer.append((new_box_mask, new_robot))
+            if stats is not None:
+                stats.generated += 1
+            if new_key in other_links:
+                return next_layer, new_key
+    return next_layer, None
+
+
+def dfs(init_board, hfn=heuristic_zero, depth_limit=None, stats=None, macros=False):
     """
     Run the DFS algorithm given an initial test_board1.txt.
 
+    The frontier is a stack, and every board pushed onto it is recorded in a hashed
+    closed set, so no board is searched twice. With a depth limit, no state deeper than
+    the limit is generated, and the closed set keeps the depth each board was reached at,
+    so that a board reached again at a smaller depth is searched again from there.
+
     If the function finds a goal state, it returns a list of states representing
     the path from the initial state to the goal state in order and the cost of
     the solution found.
@@ -117,36 +916,210 @@ def dfs(init_board):
 
     :param init_board: The initial test_board1.txt.
     :type init_board: Board
+    :param hfn: The heuristic function; states it rates infinite are pruned.
+    :type hfn: Heuristic
+    :param depth_limit: The largest depth searched, or None for no limit.
+    :type depth_limit: Optional[int]
+    :param stats: The counters to update, if any.
+    :type stats: Optional[SearchStats]
+    :param macros: Whether to take tunnel and goal-room macro moves (see get_successors).
+    :type macros: bool
     :return: (the path to goal state, solution cost)
     :rtype: List[State], int
     """
-    current_state = State(init_board, heuristic_basic, 0, 0, None)
+    current_state = State(init_board, hfn, hfn(init_board), 0, None)
+    explored = {init_board: 0}
+    frontier = [current_state]
+    while len(frontier) != 0:
+        current_state = frontier.pop()
+        if is_goal(current_state):
+            return get_path(current_state), current_state.depth
+        if depth_limit is not None and current_state.depth >= depth_limit:
+            continue
+
+        # DFS keeps the first path it finds to a board, which the reduction may cut short.
+        successors = get_successors(current_state, stats, reduce=False, macros=macros)
+        # push in reverse so that the first successor is searched first.
+        for new_state in reversed(successors):
+            if new_state.f == math.inf:
+                if stats is not None:
+                    stats.deadlocks += 1
+                continue
+            depth = explored.get(new_state.board)
+            if depth is None or (depth_limit is not None and new_state.depth < depth):
+                explored[new_state.board] = new_state.depth
+                frontier.append(new_state)
+            elif stats is not None:
+                stats.duplicates += 1
+        if stats is not None:
+            stats.record(len(frontier), len(explored))
+    return [], -1
+
+
+def bfs(init_board, hfn=heuristic_zero, stats=None, macros=False):
+    """
+    Run the BFS algorithm given an initial board.
+
+    The frontier is a FIFO queue and every board is recorded in a hashed closed set when
+    it is generated, so the first goal state generated has the smallest cost. A macro move
+    takes several moves at once, so when macro moves are taken the frontier is ordered by
+    depth instead (a Frontier of weight 0), and the search stops when a goal state is taken
+    off it.
+
+    If the function finds a goal state, it returns a list of states representing
+    the path from the initial state to the goal state in order and the cost of
+    the solution found.
+    Otherwise, it returns am empty list and -1.
+
+    :param init_board: The initial board.
+    :type init_board: Board
+    :param hfn: The heuristic function; states it rates infinite are pruned.
+    :type hfn: Heuristic
+    :param stats: The counters to update, if any.
+    :type stats: Optional[SearchStats]
+    :param macros: Whether to take tunnel and goal-room macro moves (see get_successors).
+    :type macros: bool
+    :return: (the path to goal state, solution cost)
+    :rtype: List[State], int
+    """
+    current_state = State(init_board, hfn, hfn(init_board), 0, None)
+    if macros and len(init_board.robot_cells) == 1:
+        return _bfs_by_depth(current_state, stats)
     if is_goal(current_state):
         return get_path(current_state), current_state.depth
-    explored = set()
-    frontier = get_successors(current_state)
+    explored = {init_board}
+    frontier = deque([current_state])
+    while len(frontier) != 0:
+        current_state = frontier.popleft()
+        for new_state in get_successors(current_state, stats, macros=macros):
+            if new_state.f == math.inf or new_state.board in explored:
+                if stats is not None:
+                    if new_state.f == math.inf:
+                        stats.deadlocks += 1
+                    else:
+                        stats.duplicates += 1
+                continue
+            if is_goal(new_state):
+                return get_path(new_state), new_state.depth
+            explored.add(new_state.board)
+            frontier.append(new_state)
+        if stats is not None:
+            stats.record(len(frontier), len(explored))
+    return [], -1
+
+
+def _bfs_by_depth(init_state, stats):
+    """
+    Run BFS with macro moves from the given state, expanding states in order of depth.
+    """
+    frontier = Frontier(0)
+    frontier.push(init_state)
     while len(frontier) != 0:
+        current_state = frontier.pop()
+        if current_state is None:
+            break
         if is_goal(current_state):
             return get_path(current_state), current_state.depth
+        for new_state in get_successors(current_state, stats, macros=True):
+            if not frontier.push(new_state) and stats is not None:
+                if new_state.f == math.inf:
+                    stats.deadlocks += 1
+                else:
+                    stats.duplicates += 1
+        if stats is not None:
+            stats.record(len(frontier), len(frontier.best))
+    return [], -1
 
-        explored.add(current_state.board)
-        current_state = frontier.pop(0)
 
-        for new_state in get_successors(current_state):
-            pruning = False
-            for explored_board in explored:
-                if set(explored_board.robots) == set(new_state.board.robots) and \
-                        set(explored_board.boxes) == set(new_state.board.boxes):
-                    pruning = True
-            if not pruning:
-                frontier.append(new_state)
-    return [], -1
+# Default weight on the heuristic for weighted and anytime A*, and the amount anytime A*
+# lowers it by after each solution.
+WEIGHT = 2.0
+WEIGHT_DECREMENT = 0.5
+
+
+class Frontier:
+    """
+    The open list of A*: a binary heap of states ordered by priority g + weight * h
+    (which is the f value for the default weight of 1), then by lower h value, then by
+    higher depth (g value), then by insertion order, so ties never fall back to comparing
+    states.
+
+    The frontier also records the smallest depth at which every board has been pushed,
+    whether or not it has been expanded since. A state is only pushed if it reaches its
+    board more cheaply than before, and a popped state is skipped if a cheaper path to its
+    board was pushed after it; this lazy deletion stands in for decrease-key. A board that
+    was already expanded is therefore reopened only by a strictly cheaper path.
+    """
 
+    __slots__ = ('heap', 'best', 'counter', 'weight')
 
-def a_star(init_board, hfn):
+    def __init__(self, weight=1):
+        self.heap = []
+        self.best = {}
+        self.counter = 0
+        self.weight = weight
+
+    def push(self, state):
+        """
+        Add the state unless its board was already reached at the same or a smaller depth,
+        or its f value is infinite. Returns True if the state was added.
+        """
+        if state.f == math.inf or self.best.get(state.board, math.inf) <= state.depth:
+            return False
+        self.best[state.board] = state.depth
+        heappush(self.heap, self._entry(state))
+        return True
+
+    def _entry(self, state):
+        h = state.f - state.depth
+        self.counter += 1
+        return state.depth + self.weight * h, h, -state.depth, self.counter, state
+
+    def peek(self):
+        """
+        Return the best state whose path is still the cheapest to its board without
+        removing it, or None if no such state is left.
+        """
+        heap = self.heap
+        while heap and heap[0][-1].depth != self.best[heap[0][-1].board]:
+            heappop(heap)
+        return heap[0][-1] if heap else None
+
+    def pop(self):
+        """
+        Remove and return the best state whose path is still the cheapest to its board,
+        or None if no such state is left.
+        """
+        state = self.peek()
+        if state is not None:
+            heappop(self.heap)
+        return state
+
+    def reweight(self, weight, states=()):
+        """
+        Change the weight, adding the given states (whose depths must already be recorded
+        as the best for their boards), and reorder the frontier accordingly.
+        """
+        self.weight = weight
+        live = [entry[-1] for entry in self.heap if entry[-1].depth == self.best[entry[-1].board]]
+        self.heap = [self._entry(state) for state in live + list(states)]
+        heapify(self.heap)
+
+    def __contains__(self, board):
+        return board in self.best
+
+    def __len__(self):
+        return len(self.heap)
+
+
+def a_star(init_board, hfn, weight=1, stats=None, macros=False):
     """
     Run the A_star search algorithm given an initial test_board1.txt and a heuristic function.
 
+    With a weight above 1, this is weighted A*: states are expanded in order of
+    g + weight * h, which usually finds a solution much sooner, at a cost at most
+    `weight` times the smallest one if the heuristic is admissible.
+
     If the function finds a goal state, it returns a list of states representing
     the path from the initial state to the goal state in order and the cost of
     the solution found.
@@ -156,81 +1129,498 @@ def a_star(init_board, hfn):
     :type init_board: Board
     :param hfn: The heuristic function.
     :type hfn: Heuristic (a function that consumes a Board and produces a numeric heuristic value)
+    :param weight: The weight on the heuristic value.
+    :type weight: float
+    :param stats: The counters to update, if any.
+    :type stats: Optional[SearchStats]
+    :param macros: Whether to take tunnel and goal-room macro moves (see get_successors).
+    :type macros: bool
     :return: (the path to goal state, solution cost)
     :rtype: List[State], int
     """
 
-    current_state = State(init_board, hfn, 0, 0, None)
-    if is_goal(current_state):
-        return get_path(current_state), current_state.depth
-    explored = {current_state.board}
-    frontier = []
-    for new_state in get_successors(current_state):
-        heappush(frontier, (new_state.f, new_state))
-        explored.add(new_state.board)
+    frontier = Frontier(weight)
+    frontier.push(State(init_board, hfn, hfn(init_board), 0, None))
 
     while len(frontier) != 0:
+        current_state = frontier.pop()
+        if current_state is None:
+            break
         if is_goal(current_state):
-            return get_path(current_state), current_state.f
+            return get_path(current_state), current_state.depth
+
+        # the reduction keeps the cheapest costs only when states are expanded in order of f.
+        for new_state in get_successors(current_state, stats, weight == 1, macros):
+            if not frontier.push(new_state) and stats is not None:
+                if new_state.f == math.inf:
+                    stats.deadlocks += 1
+                else:
+                    stats.duplicates += 1
+        if stats is not None:
+            stats.record(len(frontier), len(frontier.best))
+    return [], -1
+
 
-        current_state = heappop(frontier)[-1]
+def anytime_a_star(init_board, hfn, weight=WEIGHT, decrement=WEIGHT_DECREMENT, stats=None, macros=False):
+    """
+    Run anytime repairing A* (ARA*) given an initial board and a heuristic function.
+
+    The search starts as weighted A* with the given weight and reports its first solution.
+    It then lowers the weight by `decrement` (down to 1) and repairs the search instead of
+    restarting it: boards whose cost dropped after they were expanded are set aside and
+    put back into the frontier for the next round, which only expands states that can
+    still lead to a cheaper solution. Each round's solution costs at most `weight` times
+    the smallest cost, so the last round, with weight 1, ends with an optimal solution if
+    the heuristic is admissible.
+
+    This is a generator: it yields (the path to goal state, solution cost, weight) every
+    time it finds a cheaper solution, and yields nothing if there is no solution.
+
+    :param init_board: The initial starting board.
+    :type init_board: Board
+    :param hfn: The heuristic function.
+    :type hfn: Heuristic (a function that consumes a Board and produces a numeric heuristic value)
+    :param weight: The weight on the heuristic value in the first round.
+    :type weight: float
+    :param decrement: The amount the weight is lowered by after each round; must be positive.
+    :type decrement: float
+    :param stats: The counters to update, if any.
+    :type stats: Optional[SearchStats]
+    :param macros: Whether to take tunnel and goal-room macro moves (see get_successors).
+    :type macros: bool
+    """
+    if decrement <= 0:
+        raise ValueError('the weight decrement must be positive, not {}'.format(decrement))
+    frontier = Frontier(weight)
+    frontier.push(State(init_board, hfn, hfn(init_board), 0, None))
+    closed = set()
+    inconsistent = {}
+    best_state = None
+    cost = math.inf
+
+    while True:
+        improved = False
+        while frontier.peek() is not None and frontier.heap[0][0] < cost:
+            current_state = frontier.pop()
+            if is_goal(current_state):
+                best_state, cost = current_state, current_state.depth
+                improved = True
+                continue
+            closed.add(current_state.board)
+
+            for new_state in get_successors(current_state, stats, reduce=False, macros=macros):
+                # states that cannot lead to a cheaper solution are not worth keeping.
+                if new_state.f >= cost:
+                    continue
+                if new_state.board not in closed:
+                    frontier.push(new_state)
+                elif frontier.best[new_state.board] > new_state.depth:
+                    frontier.best[new_state.board] = new_state.depth
+                    inconsistent[new_state.board] = new_state
+
+        if improved:
+            yield get_path(best_state), cost, frontier.weight
+        if frontier.weight <= 1 or (frontier.peek() is None and not inconsistent):
+            return
+        frontier.reweight(max(1.0, frontier.weight - decrement), inconsistent.values())
+        inconsistent = {}
+        closed = set()
+
+
+# Default number of boards remembered by the IDA* transposition table.
+TRANSPOSITION_TABLE_SIZE = 1 << 20
+
+
+def ida_star(init_board, hfn, table_size=TRANSPOSITION_TABLE_SIZE, stats=None, macros=False):
+    """
+    Run the IDA* search algorithm given an initial board and a heuristic function.
+
+    Each iteration is a depth-first search that cuts off states whose f value exceeds
+    the bound; the next bound is the smallest f value cut off. Memory is bounded by a
+    transposition table holding at most table_size boards, evicting the least recently
+    used, which maps each board to the smallest depth it was reached at and the
+    iteration that happened in. A board is not searched again if it was reached more
+    cheaply before, or as cheaply earlier in the same iteration.
+
+    If the function finds a goal state, it returns a list of states representing
+    the path from the initial state to the goal state in order and the cost of
+    the solution found.
+    Otherwise, it returns am empty list and -1.
 
-        for new_state in get_successors(current_state):
-            if new_state.board not in explored:
-                heappush(frontier, (new_state.f, new_state))
-                explored.add(new_state.board)
+    :param init_board: The initial starting board.
+    :type init_board: Board
+    :param hfn: The heuristic function.
+    :type hfn: Heuristic (a function that consumes a Board and produces a numeric heuristic value)
+    :param table_size: The largest number of boards in the transposition table.
+    :type table_size: int
+    :param stats: The counters to update, if any.
+    :type stats: Optional[SearchStats]
+    :param macros: Whether to take tunnel and goal-room macro moves (see get_successors).
+    :type macros: bool
+    :return: (the path to goal state, solution cost)
+    :rtype: List[State], int
+    """
+    root = State(init_board, hfn, hfn(init_board), 0, None)
+    table = OrderedDict()
+    bound = root.f
+    iteration = 0
+
+    while bound != math.inf:
+        iteration += 1
+        next_bound = math.inf
+        frontier = [root]
+        while len(frontier) != 0:
+            current_state = frontier.pop()
+            if current_state.f > bound:
+                next_bound = min(next_bound, current_state.f)
+                continue
+            if is_goal(current_state):
+                return get_path(current_state), current_state.depth
+
+            entry = table.get(current_state.board)
+            if entry is not None and (entry[0] < current_state.depth or
+                                      (entry[0] == current_state.depth and entry[1] == iteration)):
+                if stats is not None:
+                    stats.duplicates += 1
+                continue
+            table[current_state.board] = (current_state.depth, iteration)
+            table.move_to_end(current_state.board)
+            if len(table) > table_size:
+                table.popitem(last=False)
+
+            # push the most promising successors last, so that they are searched first.
+            successors = get_successors(current_state, stats, macros=macros)
+            successors.sort(key=lambda state: state.f, reverse=True)
+            frontier.extend(successors)
+            if stats is not None:
+                stats.record(len(frontier), len(table))
+        bound = next_bound
     return [], -1
 
 
+# Number of states a parallel A* worker expands between sending its successor batches and
+# reading its messages, and the pause in seconds between two termination probes.
+HDA_BATCH_SIZE = 64
+HDA_PROBE_INTERVAL = 0.01
+# Seconds the HDA* coordinator waits for a message before checking that its workers are alive.
+HDA_RECEIVE_TIMEOUT = 1.0
+
+
+def hda_star(init_board, hfn, workers=None, stats=None, macros=False):
+    """
+    Run hash-distributed parallel A* (HDA*) given an initial board and a heuristic function.
+
+    Every board is owned by one of `workers` worker processes, chosen by its Zobrist key.
+    Each worker runs A* on its own frontier and expands the states it owns with
+    get_successors, sending each successor to its owner in batches over the owner's
+    queue. The cheapest solution found so far is broadcast to every worker, which then
+    drops its states whose f value is no smaller. The search ends once no worker has a
+    state left below that cost and no batch is in flight, which is detected by counting
+    the batches sent and received over two probe waves in a row; with an admissible
+    heuristic the solution is then optimal. Finally the workers send back the parent of
+    every board they own, from which the path is rebuilt.
+
+    If the function finds a goal state, it returns a list of states representing
+    the path from the initial state to the goal state in order and the cost of
+    the solution found.
+    Otherwise, it returns am empty list and -1.
+
+    :param init_board: The initial starting board.
+    :type init_board: Board
+    :param hfn: The heuristic function.
+    :type hfn: Heuristic (a function that consumes a Board and produces a numeric heuristic value)
+    :param workers: The number of worker processes, or None for one per CPU.
+    :type workers: Optional[int]
+    :param stats: The counters to update, if any.
+    :type stats: Optional[SearchStats]
+    :param macros: Whether to take tunnel and goal-room macro moves (see get_successors).
+    :type macros: bool
+    :return: (the path to goal state, solution cost)
+    :rtype: List[State], int
+    """
+    workers = workers or os.cpu_count() or 1
+    context = multiprocessing.get_context()
+    inboxes = [context.Queue() for _ in range(workers)]
+    results = context.Queue()
+    processes = [context.Process(target=_hda_worker, args=(index, init_board, hfn, macros, inboxes, results))
+                 for index in range(workers)]
+    try:
+        for process in processes:
+            process.start()
+
+        root = (init_board.robot_cells, init_board.box_mask, init_board.key)
+        inboxes[init_board.key % workers].put(('states', [root + (0, hfn(init_board), None, ())]))
+        sent = 1
+        cost, goal = math.inf, None
+
+        # probe the workers until two waves in a row find them all idle with every batch received.
+        previous = None
+        while True:
+            for inbox in inboxes:
+                inbox.put(('probe',))
+            idle, counts = True, [sent, 0]
+            replies = 0
+            while replies < workers:
+                message = _hda_receive(results, processes, range(workers))
+                if message[0] == 'goal':
+                    if message[1] < cost:
+                        cost, goal = message[1], message[2]
+                        for inbox in inboxes:
+                            inbox.put(('incumbent', cost))
+                elif message[0] == 'probe':
+                    replies += 1
+                    idle = idle and message[1]
+                    counts[0] += message[2]
+                    counts[1] += message[3]
+                elif message[0] == 'error':
+                    raise RuntimeError('HDA* worker {} failed:\n{}'.format(message[1], message[2]))
+            if idle and counts[0] == counts[1]:
+                if counts == previous:
+                    break
+                previous = counts
+            else:
+                previous = None
+                time.sleep(HDA_PROBE_INTERVAL)
+
+        for inbox in inboxes:
+            inbox.put(('stop',))
+        parents = [None] * workers
+        pending = set(range(workers))
+        while pending:
+            message = _hda_receive(results, processes, pending)
+            if message[0] == 'error':
+                raise RuntimeError('HDA* worker {} failed:\n{}'.format(message[1], message[2]))
+            if message[0] != 'done':
+                continue
+            pending.discard(message[1])
+            parents[message[1]] = message[2]
+            if stats is not None:
+                stats.merge(message[3])
+        for process in processes:
+            process.join()
+    finally:
+        for process in processes:
+            if process.is_alive():
+                process.terminate()
+        # batches still queued for a dead worker must not hold up the exit of this process.
+        for inbox in inboxes:
+            inbox.cancel_join_thread()
+
+    if goal is None:
+        return [], -1
+
+    chain = []
+    while goal is not None:
+        chain.append(goal)
+        goal, via = parents[goal[2] % workers][goal]
+        chain.extend(via)
+    state = None
+    for depth, (robot_cells, box_mask, key) in enumerate(reversed(chain)):
+        board = init_board.derive(robot_cells, box_mask, key)
+        state = State(board, hfn, hfn(board) + depth, depth, state)
+    return get_path(state), state.depth
+
+
+def _hda_receive(results, processes, pending):
+    """
+    Returns the next message of the HDA* workers, checking every HDA_RECEIVE_TIMEOUT seconds
+    that the workers it still waits on, by index in `pending`, are alive. Raises RuntimeError
+    if one of them died, e.g. killed for running out of memory, instead of waiting forever.
+    """
+    while True:
+        try:
+            return results.get(timeout=HDA_RECEIVE_TIMEOUT)
+        except queue.Empty:
+            for index in pending:
+                if not processes[index].is_alive():
+                    raise RuntimeError('HDA* worker {} died with exit code {}'.format(
+                        index, processes[index].exitcode))
+
+
+def _hda_worker(index, init_board, hfn, macros, inboxes, results):
+    """
+    The body of HDA* worker `index`. States travel between workers as tuples
+    (robot cells, box mask, key, depth, h value, parent, via), where the parent is the
+    (robot cells, box mask, key) of the board the state was generated from, and via holds
+    those of the boards inside a macro move, latest first.
+    """
+    try:
+        workers = len(inboxes)
+        inbox = inboxes[index]
+        frontier = Frontier()
+        parents = {}
+        stats = SearchStats()
+        cost = math.inf
+        sent = received = 0
+        outgoing = [[] for _ in range(workers)]
+
+        def add(entry):
+            robot_cells, box_mask, key, depth, h, parent, via = entry
+            if depth + h >= cost:
+                return
+            if frontier.push(State(init_board.derive(robot_cells, box_mask, key), hfn, depth + h, depth)):
+                parents[(robot_cells, box_mask, key)] = (parent, via)
+            elif h == math.inf:
+                stats.deadlocks += 1
+            else:
+                stats.duplicates += 1
+
+        expanded = 0
+        while True:
+            current_state = frontier.peek()
+            idle = current_state is None or current_state.f >= cost
+            if idle or expanded >= HDA_BATCH_SIZE:
+                expanded = 0
+                for owner, batch in enumerate(outgoing):
+                    if batch:
+                        inboxes[owner].put(('states', batch))
+                        outgoing[owner] = []
+                        sent += 1
+                # an idle worker waits for its next message.
+                block = idle
+                while True:
+                    try:
+                        message = inbox.get(block)
+                    except queue.Empty:
+                        break
+                    block = False
+                    if message[0] == 'states':
+                        received += 1
+                        for entry in message[1]:
+                            add(entry)
+                    elif message[0] == 'incumbent':
+                        cost = min(cost, message[1])
+                    elif message[0] == 'probe':
+                        current_state = frontier.peek()
+                        results.put(('probe', current_state is None or current_state.f >= cost, sent, received))
+                    elif message[0] == 'stop':
+                        results.put(('done', index, parents, stats.as_dict()))
+                        return
+                continue
+
+            frontier.pop()
+            expanded += 1
+            board = current_state.board
+            parent = (board.robot_cells, board.box_mask, board.key)
+            if is_goal(current_state):
+                cost = current_state.depth
+                results.put(('goal', cost, parent))
+                continue
+
+            for new_state in get_successors(current_state, stats, macros=macros):
+                via = []
+                middle = new_state.parent
+                while middle is not current_state:
+                    via.append((middle.board.robot_cells, middle.board.box_mask, middle.board.key))
+                    middle = middle.parent
+                board = new_state.board
+                entry = (board.robot_cells, board.box_mask, board.key, new_state.depth,
+                         new_state.f - new_state.depth, parent, tuple(via))
+                owner = board.key % workers
+                if owner == index:
+                    add(entry)
+                elif new_state.f < cost:
+                    outgoing[owner].append(entry)
+            stats.record(len(frontier), len(frontier.best))
+    except Exception:
+        results.put(('error', index, traceback.format_exc()))
+
+
 def heuristic_basic(board):
     """
     Returns the heuristic value for the given test_board1.txt
     based on the Manhattan Distance Heuristic function.
 
     Returns the sum of the Manhattan distances between each box
-    and its closest storage point.
+    and its closest storage point, as precomputed per cell by the level.
 
     :param board: The current test_board1.txt.
     :type board: Board
     :return: The heuristic value.
     :rtype: int
     """
+    nearest = board.level.nearest_manhattan
     total_distance = 0
 
-    for box in board.boxes:
-        shortest = -1
-        for storage in board.storage:
-            dist = abs(storage[0] - box[0]) + abs(storage[1] - box[1])
-            if shortest == -1 or dist < shortest:
-                shortest = dist
-        total_distance += shortest
+    for box in iter_cells(board.box_mask):
+        total_distance += nearest[box]
 
     return total_distance
 
 
+def _update_basic(board, h, old_cell, new_cell):
+    """
+    Returns heuristic_basic of a board from the value h of its parent, whose box on
+    old_cell was pushed to new_cell.
+    """
+    nearest = board.level.nearest_manhattan
+    return h - nearest[old_cell] + nearest[new_cell]
+
+
+heuristic_basic.uses_robots = False
+heuristic_basic.update = _update_basic
+
+
+def heuristic_push(board):
+    """
+    Returns the sum of the push distances from each box to its closest storage point,
+    i.e. heuristic_advanced without the robot term.
+
+    :param board: The current board.
+    :type board: Board
+    :return: The heuristic value.
+    :rtype: int
+    """
+    nearest = board.level.nearest_push
+    total_distance = 0
+    for box in iter_cells(board.box_mask):
+        # a box that cannot be pushed to any storage point is a deadlock.
+        if nearest[box] == UNREACHABLE:
+            return math.inf
+        total_distance += nearest[box]
+    return total_distance
+
+
+def _update_push(board, h, old_cell, new_cell):
+    """
+    Returns heuristic_push of a board from the value h of its parent, whose box on
+    old_cell was pushed to new_cell.
+    """
+    nearest = board.level.nearest_push
+    if nearest[new_cell] == UNREACHABLE:
+        return math.inf
+    return h - nearest[old_cell] + nearest[new_cell]
+
+
+heuristic_push.uses_robots = False
+heuristic_push.update = _update_push
+
+
 def heuristic_advanced(board):
     """
     An advanced heuristic of your own choosing and invention.
 
+    Sums the push distance from each box to its closest storage point, which unlike
+    the Manhattan distance goes around walls, and adds the distance from the closest
+    robot to a box that still has to move.
+
     :param board: The current test_board1.txt.
     :type board: Board
     :return: The heuristic value.
     :rtype: int
     """
+    level = board.level
+    nearest = level.nearest_push
     total_distance = 0
     closest_bot = -1
-    for box in board.boxes:
-        if add_tuples(box, (0, 1)) in board.obstacles or add_tuples(box, (0, -1)) in board.obstacles:
-            if add_tuples(box, (1, 0)) in board.obstacles or add_tuples(box, (-1, 0)) in board.obstacles:
-                if box not in board.storage:
-                    return math.inf
-        shortest = -1
-        for storage in board.storage:
-            dist = abs(storage[0] - box[0]) + abs(storage[1] - box[1])
-            if shortest == -1 or dist < shortest:
-                shortest = dist
+    for cell in iter_cells(board.box_mask):
+        shortest = nearest[cell]
+        # a box on a dead cell (e.g. in a corner) can never reach storage.
+        if shortest == UNREACHABLE:
+            return math.inf
         total_distance += shortest
         if shortest != 0:
+            box = level.xy[cell]
             for robot in board.robots:
                 dist = abs(robot[0] - box[0]) + abs(robot[1] - box[1])
                 if closest_bot == -1 or dist < closest_bot:
@@ -241,7 +1631,619 @@ def heuristic_advanced(board):
     return total_distance + closest_bot - 1
 
 
-def solve_puzzle(board: Board, algorithm: str, hfn):
+heuristic_advanced.uses_robots = True
+
+
+# Number of box configurations whose matchings are kept per level for incremental re-solving.
+MATCHING_CACHE_SIZE = 100000
+
+
+# Number of heuristic values heuristic_values remembers per level and heuristic.
+HEURISTIC_CACHE_SIZE = 1 << 16
+
+
+def heuristic_values(hfn, boards, stats=None):
+    """
+    Returns the heuristic values of a batch of boards, such as the successors of one state.
+    All boards must belong to the same level and have the same numbers of robots and boxes.
+
+    The values are remembered in an LRU cache per level and heuristic, of at most
+    HEURISTIC_CACHE_SIZE entries. A heuristic whose `uses_robots` attribute is False
+    depends on the boxes alone, so its values are keyed by the box cells and shared by every
+    board that only differs in where the robots stand; any other heuristic is keyed by
+    the robot cells too. Only the boards whose values are not cached are evaluated.
+
+    :param hfn: The heuristic function.
+    :type hfn: Heuristic
+    :param boards: The boards to evaluate.
+    :type boards: List[Board]
+    :param stats: The counters to update with the cache hits and misses, if any.
+    :type stats: Optional[SearchStats]
+    :return: The heuristic value of each board, in order.
+    :rtype: List[int]
+    """
+    if hfn is heuristic_zero or not boards:
+        return [0] * len(boards)
+
+    level = boards[0].level
+    cache = level.memo.get(hfn)
+    if cache is None:
+        cache = level.memo[hfn] = OrderedDict()
+    if getattr(hfn, 'uses_robots', True):
+        keys = [(board.box_mask, tuple(sorted(board.robot_cells))) for board in boards]
+    else:
+        keys = [board.box_mask for board in boards]
+
+    values = []
+    missing = {}
+    for i, key in enumerate(keys):
+        value = cache.get(key)
+        if value is None:
+            missing.setdefault(key, i)
+        else:
+            cache.move_to_end(key)
+        values.append(value)
+    if missing:
+        for key, i in missing.items():
+            cache[key] = hfn(boards[i])
+        while len(cache) > HEURISTIC_CACHE_SIZE:
+            cache.popitem(last=False)
+        values = [cache[key] if value is None else value for key, value in zip(keys, values)]
+
+    if stats is not None:
+        stats.heuristic_misses += len(missing)
+        stats.heuristic_hits += len(boards) - len(missing)
+    return values
+
+
+def heuristic_matching(board):
+    """
+    Returns the cost of an optimal assignment of boxes to distinct storage points,
+    where the cost of a box on a storage point is its push distance to it.
+
+    Unlike heuristic_basic, no two boxes can claim the same storage point, and walls are
+    taken into account. The assignment is found with the Hungarian algorithm on a square
+    matrix (padded with zero-cost rows when there are more storage points than boxes).
+    Solutions are remembered per box configuration; when the board was reached by a single
+    push from a remembered configuration, only the pushed box's row is re-solved, which
+    takes one augmentation instead of one per box.
+
+    :param board: The current board.
+    :type board: Board
+    :return: The heuristic value.
+    :rtype: int
+    """
+    level = board.level
+    box_mask = board.box_mask
+    memo = level.memo.setdefault('matching', {})
+    matching = memo.get(box_mask)
+
+    if matching is None:
+        # look for the configuration this one was pushed from: the pushing robot stands
+        # on the box's old cell, with the box in front of it.
+        for robot in board.robot_cells:
+            for step in level.steps:
+                box = step[robot]
+                parent = memo.get(box_mask ^ (1 << box) ^ (1 << robot)) if box_mask >> box & 1 else None
+                if parent is not None:
+                    matching = _rematch(level, parent, robot, box)
+                    break
+            if matching is not None:
+                break
+        else:
+            matching = _match(level, box_mask)
+        if len(memo) >= MATCHING_CACHE_SIZE:
+            memo.clear()
+        memo[box_mask] = matching
+
+    return matching[-1]
+
+
+def _update_matching(board, h, old_cell, new_cell):
+    """
+    Returns heuristic_matching of a board whose parent's box on old_cell was pushed to
+    new_cell, re-solving only the pushed box's row of the parent's assignment when it is
+    remembered.
+    """
+    level = board.level
+    box_mask = board.box_mask
+    memo = level.memo.setdefault('matching', {})
+    matching = memo.get(box_mask)
+    if matching is None:
+        parent = memo.get(box_mask ^ (1 << new_cell) ^ (1 << old_cell))
+        if parent is not None:
+            matching = _rematch(level, parent, old_cell, new_cell)
+        else:
+            matching = _match(level, box_mask)
+        if len(memo) >= MATCHING_CACHE_SIZE:
+            memo.clear()
+        memo[box_mask] = matching
+    return matching[-1]
+
+
+heuristic_matching.uses_robots = False
+heuristic_matching.update = _update_matching
+
+
+def _match(level, box_mask):
+    """
+    Solves the assignment problem for the given box configuration from scratch.
+    Returns (box cells in row order, cost rows, row potentials, column potentials, row of each column, total).
+    """
+    cells = list(iter_cells(box_mask))
+    m = len(level.goal_cells)
+    if len(cells) > m:
+        return cells, None, None, None, None, math.inf
+    costs = [_match_costs(level, cell) for cell in cells] + [[0] * m for _ in range(m - len(cells))]
+    u = [0] * (m + 1)
+    v = [0] * (m + 1)
+    p = [0] * (m + 1)
+    for row in range(1, m + 1):
+        _augment(costs, u, v, p, row)
+    return cells, costs, u, v, p, _match_total(costs, p)
+
+
+def _rematch(level, parent, old_cell, new_cell):
+    """
+    Re-solves the parent's assignment after the box on old_cell was pushed to new_cell.
+    The other rows keep their assignment and potentials, which stay optimal for them,
+    so a single augmentation from the pushed box's row restores an optimal assignment.
+    """
+    cells, costs, u, v, p, total = parent
+    if costs is None:
+        return parent
+    row = cells.index(old_cell) + 1
+    cells = cells[:]
+    cells[row - 1] = new_cell
+    costs = costs[:]
+    costs[row - 1] = _match_costs(level, new_cell)
+    u = u[:]
+    v = v[:]
+    p = p[:]
+    p[p.index(row, 1)] = 0
+    u[row] = 0
+    _augment(costs, u, v, p, row)
+    return cells, costs, u, v, p, _match_total(costs, p)
+
+
+def _match_costs(level, cell):
+    stride = level.size + 1
+    return level.push_distances[cell::stride]
+
+
+def _match_total(costs, p):
+    total = 0
+    for j in range(1, len(p)):
+        total += costs[p[j] - 1][j - 1]
+    return math.inf if total >= UNREACHABLE else total
+
+
+def _augment(costs, u, v, p, row):
+    """
+    One phase of the Hungarian algorithm: assigns the 1-based `row` through a shortest
+    augmenting path, keeping the potentials u, v feasible and every assigned cell tight.
+    p[j] is the row assigned to column j, or 0.
+    """
+    m = len(v) - 1
+    p[0] = row
+    j0 = 0
+    minv = [math.inf] * (m + 1)
+    way = [0] * (m + 1)
+    used = [False] * (m + 1)
+    while True:
+        used[j0] = True
+        i0 = p[j0]
+        row_costs = costs[i0 - 1]
+        ui0 = u[i0]
+        delta = math.inf
+        j1 = 0
+        for j in range(1, m + 1):
+            if not used[j]:
+                cur = row_costs[j - 1] - ui0 - v[j]
+                if cur < minv[j]:
+                    minv[j] = cur
+                    way[j] = j0
+                if minv[j] < delta:
+                    delta = minv[j]
+                    j1 = j
+        for j in range(m + 1):
+            if used[j]:
+                u[p[j]] += delta
+                v[j] -= delta
+            else:
+                minv[j] -= delta
+        j0 = j1
+        if p[j0] == 0:
+            break
+    while j0:
+        j1 = way[j0]
+        p[j0] = p[j1]
+        j0 = j1
+
+
+# Default file of the SolutionCache, next to this module.
+CACHE_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'sokoban_cache.sqlite')
+# Seconds a connection waits for another process to finish writing before giving up.
+CACHE_TIMEOUT = 30.0
+
+
+class SolutionCache:
+    """
+    An SQLite file that keeps results across runs:
+
+    - the solutions found for each puzzle, keyed by the fingerprint of its initial board and
+      the search that found them, as a cost and a move string (see solution_moves);
+    - tables computed per level, such as pattern databases, keyed by the fingerprint of the
+      level layout and a table name, as bytes.
+
+    Several processes may use the same file at once.
+    """
+
+    def __init__(self, filename=CACHE_FILE):
+        """
+        :param filename: The SQLite file, created if it does not exist.
+        :type filename: str
+        """
+        self.filename = filename
+        self.connection = sqlite3.connect(filename, timeout=CACHE_TIMEOUT)
+        self.connection.execute('PRAGMA journal_mode=WAL')
+        self.connection.execute('CREATE TABLE IF NOT EXISTS solutions (fingerprint TEXT, search TEXT, '
+                                'cost INTEGER, moves TEXT, PRIMARY KEY (fingerprint, search))')
+        self.connection.execute('CREATE TABLE IF NOT EXISTS level_tables (fingerprint TEXT, name TEXT, '
+                                'data BLOB, PRIMARY KEY (fingerprint, name))')
+        self.connection.commit()
+
+    def get_solution(self, board, search):
+        """
+        Returns the cached (cost, move string) of the puzzle for the given search, or None.
+        A cost of -1 means the search found no solution.
+
+        :param board: The initial board.
+        :type board: Board
+        :param search: The search, e.g. its algorithm, heuristic and options.
+        :type search: str
+        :rtype: Optional[Tuple[int, str]]
+        """
+        row = self.connection.execute('SELECT cost, moves FROM solutions WHERE fingerprint = ? AND search = ?',
+                                      (board.fingerprint(), search)).fetchone()
+        return None if row is None else (row[0], row[1])
+
+    def put_solution(self, board, search, cost, moves):
+        """
+        Saves the result of the given search on the puzzle.
+        """
+        self.connection.execute('INSERT OR REPLACE INTO solutions VALUES (?, ?, ?, ?)',
+                                (board.fingerprint(), search, cost, moves))
+        self.connection.commit()
+
+    def get_table(self, level, name):
+        """
+        Returns the bytes of the named table of the level, or None.
+
+        :param level: The level.
+        :type level: Level
+        :param name: The name of the table.
+        :type name: str
+        :rtype: Optional[bytes]
+        """
+        row = self.connection.execute('SELECT data FROM level_tables WHERE fingerprint = ? AND name = ?',
+                                      (level.fingerprint(), name)).fetchone()
+        return None if row is None else bytes(row[0])
+
+    def put_table(self, level, name, data):
+        """
+        Saves the bytes of the named table of the level.
+        """
+        self.connection.execute('INSERT OR REPLACE INTO level_tables VALUES (?, ?, ?)',
+                                (level.fingerprint(), name, sqlite3.Binary(data)))
+        self.connection.commit()
+
+    def close(self):
+        self.connection.close()
+
+
+# Pattern database entry of a pair of cells the two boxes can never be pushed to storage from.
+PDB_UNREACHABLE = 0xFFFF
+
+
+def heuristic_pdb(board):
+    """
+    A pattern database heuristic over pairs of boxes.
+
+    The pattern database of a level holds, for every pair of cells, the fewest pushes that
+    take two boxes on those cells to two different storage points when they are alone on
+    the level, with the robot starting anywhere. Unlike the push distances of single boxes,
+    this accounts for the boxes blocking each other, and a pair that cannot be solved at all
+    shows the board is deadlocked.
+
+    The boxes are split greedily into disjoint pairs, taking first the pairs whose entry
+    exceeds the push distances of their two boxes the most; a box left over counts its push
+    distance. As every push moves a single box, the pushes of disjoint pairs add up. The
+    result is at least the Manhattan distance heuristic and never more than the solution cost.
+
+    The database is built for a single robot, which on a board with several robots may be
+    unable to reach a box from the side a lone robot would need, or may push it from both
+    sides at once; there, the push distance heuristic is used instead.
+
+    :param board: The current board.
+    :type board: Board
+    :return: The heuristic value.
+    :rtype: int
+    """
+    if len(board.robot_cells) != 1:
+        return heuristic_push(board)
+    level = board.level
+    nearest = level.nearest_push
+    pdb = pattern_database(level)
+    size = level.size
+    boxes = list(iter_cells(board.box_mask))
+    total = 0
+    for cell in boxes:
+        if nearest[cell] == UNREACHABLE:
+            return math.inf
+        total += nearest[cell]
+    if total == 0:
+        return 0
+
+    gains = []
+    for a, b in combinations(boxes, 2):
+        pair = pdb[a * size + b]
+        if pair == PDB_UNREACHABLE:
+            return math.inf
+        gain = pair - nearest[a] - nearest[b]
+        if gain > 0:
+            gains.append((gain, a, b))
+    gains.sort(reverse=True)
+    paired = set()
+    for gain, a, b in gains:
+        if a not in paired and b not in paired:
+            paired.add(a)
+            paired.add(b)
+            total += gain
+    return max(total, heuristic_basic(board))
+
+
+heuristic_pdb.uses_robots = False
+
+
+def pattern_database(level, cache=None):
+    """
+    Return the pair pattern database of the level: a flat array of (size * size) entries
+    whose entry a * size + b, for cells a and b, is the fewest pushes that take boxes on a and
+    b to two different storage points, or PDB_UNREACHABLE.
+
+    The database is built once per level, by a breadth-first search that pulls pairs of boxes
+    back from every pair of storage points. With a cache, it is saved under the fingerprint of
+    the level layout, so that later runs of the same level load it instead; cached_search
+    passes its cache in through heuristic_pdb.prepare before searching. Only boards with a
+    single robot use the database.
+
+    :param level: The level.
+    :type level: Level
+    :param cache: The cache to load the database from and save it to, or None.
+    :type cache: Optional[SolutionCache]
+    :rtype: array
+    """
+    pdb = level.memo.get('pdb')
+    if pdb is not None:
+        return pdb
+
+    data = cache.get_table(level, 'pdb_pairs') if cache is not None else None
+    pdb = array('H')
+    if data is not None and len(data) == level.size * level.size * pdb.itemsize:
+        pdb.frombytes(data)
+    else:
+        pdb = _build_pattern_database(level)
+        if cache is not None:
+            cache.put_table(level, 'pdb_pairs', pdb.tobytes())
+
+    level.memo['pdb'] = pdb
+    return pdb
+
+
+def _prepare_pdb(board, cache):
+    """
+    Load or build the pattern database of a board with a single robot before a search.
+    """
+    if len(board.robot_cells) == 1:
+        pattern_database(board.level, cache)
+
+
+heuristic_pdb.prepare = _prepare_pdb
+
+
+def _build_pattern_database(level):
+    """
+    Build the pair pattern database by a breadth-first search over (box, box, robot region)
+    states, going backwards: a robot next to a box steps away from it, pulling the box along.
+    The robot is represented by the smallest cell it can walk to.
+    """
+    size = level.size
+    walls = level.walls
+    steps = level.steps
+    pdb = array('H', [PDB_UNREACHABLE]) * (size * size)
+
+    def region(start, a, b):
+        reached = {start}
+        stack = [start]
+        while stack:
+            cell = stack.pop()
+            for step in steps:
+                new_pos = step[cell]
+                if new_pos not in reached and not walls[new_pos] and new_pos != a and new_pos != b:
+                    reached.add(new_pos)
+                    stack.append(new_pos)
+        return reached
+
+    seen = set()
+    layer = []
+    free = [c for c in range(size) if not walls[c]]
+    for a, b in combinations(level.goal_cells, 2):
+        pdb[a * size + b] = pdb[b * size + a] = 0
+        covered = set()
+        for cell in free:
+            if cell != a and cell != b and cell not in covered:
+                reached = region(cell, a, b)
+                covered |= reached
+                seen.add((a, b, min(reached)))
+                layer.append((a, b, reached))
+
+    distance = 0
+    while layer:
+        distance += 1
+        next_layer = []
+        for a, b, reached in layer:
+            for box, other in ((a, b), (b, a)):
+                for step in steps:
+                    robot = step[box]
+                    new_robot = step[robot]
+                    if robot not in reached or walls[new_robot] or new_robot == other:
+                        continue
+                    new_a, new_b = min(robot, other), max(robot, other)
+                    new_reached = region(new_robot, new_a, new_b)
+                    key = (new_a, new_b, min(new_reached))
+                    if key in seen:
+                        continue
+                    seen.add(key)
+                    next_layer.append((new_a, new_b, new_reached))
+                    if pdb[new_a * size + new_b] == PDB_UNREACHABLE:
+                        pdb[new_a * size + new_b] = pdb[new_b * size + new_a] = distance
+        layer = next_layer
+    return pdb
+
+
+# The search algorithms, by name, with the description solve_puzzle prints for each.
+ALGORITHMS = {
+    'a_star': "A* search",
+    'weighted_a_star': "weighted A* search",
+    'anytime_a_star': "anytime A* search",
+    'a_star_pushes': "push-level A* search",
+    'bidirectional': "bidirectional push search",
+    'ida_star': "IDA* search",
+    'hda_star': "hash-distributed parallel A* search",
+    'dfs': "DFS",
+    'bfs': "BFS",
+}
+
+# The heuristic functions, by name.
+HEURISTICS = {
+    'zero': heuristic_zero,
+    'basic': heuristic_basic,
+    'advanced': heuristic_advanced,
+    'push': heuristic_push,
+    'matching': heuristic_matching,
+    'pdb': heuristic_pdb,
+}
+
+
+def search(board: Board, algorithm: str, hfn, depth_limit=None, table_size=TRANSPOSITION_TABLE_SIZE,
+           weight=WEIGHT, weight_decrement=WEIGHT_DECREMENT, search_workers=None, stats=None, on_solution=None,
+           macros=False):
+    """
+    Run the given search algorithm on the given puzzle.
+
+    :param board: The initial board.
+    :type board: Board
+    :param algorithm: the search algorithm, one of ALGORITHMS
+    :type algorithm: str
+    :param hfn: The heuristic function
+    :type hfn: Optional[Heuristic]
+    :param depth_limit: The largest depth searched by DFS, or None for no limit.
+    :type depth_limit: Optional[int]
+    :param table_size: The largest number of boards in the IDA* transposition table.
+    :type table_size: int
+    :param weight: The weight on the heuristic for weighted and anytime A*.
+    :type weight: float
+    :param weight_decrement: The amount anytime A* lowers the weight by after each solution.
+    :type weight_decrement: float
+    :param search_workers: The number of HDA* worker processes, or None for one per CPU.
+    :type search_workers: Optional[int]
+    :param stats: The counters to update, if any.
+    :type stats: Optional[SearchStats]
+    :param on_solution: Called with the cost and weight of every solution anytime A* finds.
+    :type on_solution: Optional[Callable[[int, float], None]]
+    :param macros: Whether to replace pushes by tunnel and goal-room macro moves where stopping
+                   after the push is useless (see get_successors), which reach the far end of
+                   tunnels in one expansion on boards with a single robot. The push-level
+                   searches, a_star_pushes and bidirectional, do not use them.
+    :type macros: bool
+    :return: (the path to goal state, solution cost)
+    :rtype: List[State], int
+    """
+    if algorithm == 'a_star':
+        return a_star(board, hfn, stats=stats, macros=macros)
+    elif algorithm == 'weighted_a_star':
+        return a_star(board, hfn, weight, stats, macros)
+    elif algorithm == 'anytime_a_star':
+        path, step = [], -1
+        for path, step, current_weight in anytime_a_star(board, hfn, weight, weight_decrement, stats, macros):
+            if on_solution is not None:
+                on_solution(step, current_weight)
+        return path, step
+    elif algorithm == 'ida_star':
+        return ida_star(board, hfn, table_size, stats, macros)
+    elif algorithm == 'hda_star':
+        return hda_star(board, hfn, search_workers, stats, macros)
+    elif algorithm == 'a_star_pushes':
+        return a_star_pushes(board, hfn, stats)
+    elif algorithm == 'bidirectional':
+        return bidirectional(board, hfn, stats)
+    elif algorithm == 'dfs':
+        return dfs(board, hfn, depth_limit, stats, macros)
+    elif algorithm == 'bfs':
+        return bfs(board, hfn, stats, macros)
+    else:
+        raise NotImplementedError
+
+
+def cached_search(cache, board: Board, algorithm: str, hfn, depth_limit=None, table_size=TRANSPOSITION_TABLE_SIZE,
+                  weight=WEIGHT, weight_decrement=WEIGHT_DECREMENT, search_workers=None, stats=None,
+                  on_solution=None, macros=False):
+    """
+    Run search, unless the cache already holds its result for this puzzle; a new result is
+    saved to the cache. Searches are told apart by their algorithm, heuristic and the options
+    that change their result, such as the weight of weighted A*. A heuristic with a `prepare`
+    function, such as heuristic_pdb, is first given the cache to load its tables from.
+
+    :param cache: The cache, or None to always search.
+    :type cache: Optional[SolutionCache]
+    :return: (the path to goal state, solution cost, whether it came from the cache)
+    :rtype: List[State], int, bool
+    """
+    key = '{}/{}'.format(algorithm, hfn.__name__)
+    if algorithm in ('weighted_a_star', 'anytime_a_star'):
+        key += '/weight={}'.format(weight)
+    if algorithm == 'anytime_a_star':
+        key += '/decrement={}'.format(weight_decrement)
+    if algorithm == 'dfs' and depth_limit is not None:
+        key += '/depth_limit={}'.format(depth_limit)
+    if macros and algorithm not in ('a_star_pushes', 'bidirectional'):
+        key += '/macros'
+
+    prepare = getattr(hfn, 'prepare', None)
+    if cache is not None and prepare is not None:
+        prepare(board, cache)
+
+    cached = cache.get_solution(board, key) if cache is not None else None
+    if cached is not None:
+        step, moves = cached
+        if step < 0:
+            return [], step, True
+        state = None
+        for depth, new_board in enumerate(replay(board, moves)):
+            state = State(new_board, hfn, hfn(new_board) + depth, depth, state)
+        return get_path(state), step, True
+
+    path, step = search(board, algorithm, hfn, depth_limit, table_size, weight, weight_decrement, search_workers,
+                        stats, on_solution, macros)
+    if cache is not None:
+        cache.put_solution(board, key, step, solution_moves(path) if path else '')
+    return path, step, False
+
+
+def solve_puzzle(board: Board, algorithm: str, hfn, depth_limit=None, table_size=TRANSPOSITION_TABLE_SIZE,
+                 weight=WEIGHT, weight_decrement=WEIGHT_DECREMENT, search_workers=None, stats_file=None,
+                 output_format='boards', cache_file=None, macros=False):
     """
     Solve the given puzzle using the given type of algorithm.
 
@@ -249,6 +2251,27 @@ def solve_puzzle(board: Board, algorithm: str, hfn):
     :type algorithm: str
     :param hfn: The heuristic function
     :type hfn: Optional[Heuristic]
+    :param depth_limit: The largest depth searched by DFS, or None for no limit.
+    :type depth_limit: Optional[int]
+    :param table_size: The largest number of boards in the IDA* transposition table.
+    :type table_size: int
+    :param weight: The weight on the heuristic for weighted and anytime A*.
+    :type weight: float
+    :param weight_decrement: The amount anytime A* lowers the weight by after each solution.
+    :type weight_decrement: float
+    :param search_workers: The number of HDA* worker processes, or None for one per CPU.
+    :type search_workers: Optional[int]
+    :param stats_file: The file the search statistics are saved to as JSON, if any.
+    :type stats_file: Optional[str]
+    :param output_format: 'boards' to print every board on the solution, or 'moves' to
+                          print its move string.
+    :type output_format: str
+    :param cache_file: The SQLite file of the SolutionCache to look the solution up in and save it
+                       to, if any.
+    :type cache_file: Optional[str]
+    :param macros: Whether to search with tunnel and goal-room macro moves in place of single
+                   pushes (see get_successors).
+    :type macros: bool
 
     :return: the path from the initial state to the goal state
     :rtype: List[State]
@@ -257,20 +2280,43 @@ def solve_puzzle(board: Board, algorithm: str, hfn):
     print("Initial test_board1.txt")
     board.display()
 
+    if algorithm not in ALGORITHMS:
+        raise NotImplementedError
+    if algorithm == 'weighted_a_star':
+        print("Executing {} with weight {}".format(ALGORITHMS[algorithm], weight))
+    elif algorithm == 'anytime_a_star':
+        print("Executing {} from weight {}".format(ALGORITHMS[algorithm], weight))
+    else:
+        print("Executing {}".format(ALGORITHMS[algorithm]))
+    if macros:
+        print("Using tunnel and goal-room macro moves")
+
     time_start = time.time()
 
-    if algorithm == 'a_star':
-        print("Executing A* search")
-        path, step = a_star(board, hfn)
-    elif algorithm == 'dfs':
-        print("Executing DFS")
-        path, step = dfs(board, hfn)
-    else:
-        raise NotImplementedError
+    def report(step, current_weight):
+        print('Solution cost {} found with weight {} after {:.2f}s'.format(
+            step, current_weight, time.time() - time_start))
+
+    stats = SearchStats()
+    cache = SolutionCache(cache_file) if cache_file is not None else None
+    path, step, cached = cached_search(cache, board, algorithm, hfn, depth_limit, table_size, weight,
+                                       weight_decrement, search_workers, stats, report, macros)
+    if cache is not None:
+        cache.close()
+    if cached:
+        print('Solution loaded from the cache')
 
     time_end = time.time()
     time_elapsed = time_end - time_start
 
+    statistics = dict(puzzle=board.name, algorithm=algorithm, heuristic=hfn.__name__, cost=step,
+                      time=round(time_elapsed, 6), cached=cached, **stats.as_dict())
+    print('Search statistics: {}'.format(json.dumps(statistics)))
+    if stats_file is not None:
+        outputfile = open(stats_file, "w")
+        json.dump(statistics, outputfile, indent=2)
+        outputfile.close()
+
     if not path:
 
         print('No solution for this puzzle')
@@ -283,12 +2329,12 @@ def solve_puzzle(board: Board, algorithm: str, hfn):
 
         print('Solution is: ')
 
-        counter = 0
-        while counter < len(path):
-            print(counter + 1)
-            path[counter].board.display()
-            print()
-            counter += 1
+        if output_format == 'moves':
+            print(solution_moves(path))
+        else:
+            for start in range(0, len(path), OUTPUT_CHUNK):
+                print(''.join('{}\n{}\n\n'.format(counter + 1, path[counter].board)
+                              for counter in range(start, min(start + OUTPUT_CHUNK, len(path)))), end='')
 
         print('Solution cost: {}'.format(step))
         print('Time taken: {:.2f}s'.format(time_elapsed))
@@ -296,56 +2342,856 @@ def solve_puzzle(board: Board, algorithm: str, hfn):
         return path
 
 
+# The letter of each direction in DIRECTIONS in a move string; a push is written in upper case.
+MOVE_CHARS = 'rdlu'
+# Number of boards rendered at a time when writing a solution in the boards format.
+OUTPUT_CHUNK = 256
+
+
+def solution_moves(path):
+    """
+    Return the moves of a solution path as a string, one letter per move: r, d, l or u
+    for a step right, down, left or up, in upper case if the step pushes a box.
+
+    With several robots, the string is a space-separated list of runs of moves by the
+    same robot, each starting with the letter of the robot: "auL bdR" means robot a
+    steps up and pushes left, then robot b steps down and pushes right.
+
+    :param path: the path from the initial state to the goal state
+    :type path: List[State]
+    :rtype: str
+    """
+    runs = []
+    robot = None
+    for state, next_state in zip(path, path[1:]):
+        board, next_board = state.board, next_state.board
+        for i, (old_pos, new_pos) in enumerate(zip(board.robot_cells, next_board.robot_cells)):
+            if old_pos != new_pos:
+                break
+        direction = next(d for d, step in enumerate(board.level.steps) if step[old_pos] == new_pos)
+        move = MOVE_CHARS[direction]
+        if board.box_mask != next_board.box_mask:
+            move = move.upper()
+        if i != robot:
+            runs.append([chr(ord(CHAR_ROBOT) + i)])
+            robot = i
+        runs[-1].append(move)
+    if path and len(path[0].board.robot_cells) == 1:
+        return ''.join(move for run in runs for move in run[1:])
+    return ' '.join(''.join(run) for run in runs)
+
+
+def parse_moves(board, moves):
+    """
+    Generate the (robot, direction) of each move in a move string made by solution_moves.
+
+    :param board: The initial board.
+    :type board: Board
+    :param moves: The move string.
+    :type moves: str
+    """
+    if len(board.robot_cells) == 1:
+        runs = [CHAR_ROBOT + moves]
+    else:
+        runs = moves.split()
+    for run in runs:
+        robot = ord(run[0]) - ord(CHAR_ROBOT)
+        for move in run[1:]:
+            yield robot, MOVE_CHARS.index(move.lower())
+
+
+def replay(board, moves):
+    """
+    Generate the boards of a solution one at a time, from the initial board to the goal,
+    by playing a move string made by solution_moves. Nothing is rendered until a board
+    is printed, so a long solution can be checked or shown in part cheaply.
+
+    :param board: The initial board.
+    :type board: Board
+    :param moves: The move string.
+    :type moves: str
+    """
+    yield board
+    for robot, direction in parse_moves(board, moves):
+        board = apply_move(board, robot, direction)
+        yield board
+
+
+def write_solution(path, filename, output_format='boards'):
+    """
+    Save a solution path to the given file. An empty path gives an empty file.
+
+    In the boards format, the file holds every board on the path, numbered from 1.
+    In the moves format, it holds the initial board in the puzzle file format followed
+    by a line with the move string of solution_moves; read_solution reads it back.
+
+    :param path: the path from the initial state to the goal state
+    :type path: List[State]
+    :param filename: The name of the file.
+    :type filename: str
+    :param output_format: 'boards' or 'moves'.
+    :type output_format: str
+    """
+    outputfile = open(filename, "w")
+    if not path:
+        pass
+    elif output_format == 'moves':
+        board = path[0].board
+        outputfile.write('{}\n{}\n{}\n{}{}\n'.format(board.name, board.width, board.height, board,
+                                                    solution_moves(path)))
+    else:
+        # render and write a chunk of boards at a time instead of a line at a time.
+        for start in range(0, len(path), OUTPUT_CHUNK):
+            outputfile.write(''.join('{}\n{}\n'.format(counter + 1, path[counter].board)
+                                     for counter in range(start, min(start + OUTPUT_CHUNK, len(path)))))
+    outputfile.close()
+
+
+def read_solution(filename):
+    """
+    Read a solution saved in the moves format.
+
+    :param filename: The name of the file.
+    :type filename: str
+    :return: the initial board and the move string, to be played with replay.
+    :rtype: Board, str
+    """
+    board = read_from_file(filename)
+    solution_file = open(filename, "r")
+    lines = solution_file.read().splitlines()
+    solution_file.close()
+    moves = lines[3 + board.height] if len(lines) > 3 + board.height else ''
+    return board, moves
+
+
+class SearchTimeout(Exception):
+    """
+    Raised inside a batch worker when a puzzle runs out of time.
+    """
+
+
+def _raise_timeout(signum, frame):
+    raise SearchTimeout()
+
+
+def _limit_memory(memory_limit):
+    """
+    Process pool initializer: caps the address space of the worker at memory_limit megabytes.
+    """
+    if memory_limit and resource is not None:
+        limit = memory_limit * 1024 * 1024
+        resource.setrlimit(resource.RLIMIT_AS, (limit, limit))
+
+
+def _solve_file(inputfile, outputfile, algorithm, heuristic, timeout, output_format, cache_file, options):
+    """
+    Batch worker: solves one puzzle file, writes its solution, and returns its summary row.
+    """
+    row = {'puzzle': os.path.basename(inputfile), 'status': 'solved', 'cost': -1, 'nodes_expanded': 0,
+           'wall_time': 0.0, 'cached': False}
+    stats = SearchStats()
+    time_start = time.time()
+    path = []
+    cache = SolutionCache(cache_file) if cache_file is not None else None
+    if timeout:
+        signal.signal(signal.SIGALRM, _raise_timeout)
+        signal.setitimer(signal.ITIMER_REAL, timeout)
+    try:
+        path, row['cost'], row['cached'] = cached_search(cache, read_from_file(inputfile), algorithm,
+                                                         HEURISTICS[heuristic], stats=stats, **options)
+        if not path:
+            row['status'] = 'unsolvable'
+    except SearchTimeout:
+        row['status'] = 'timeout'
+    except MemoryError:
+        row['status'] = 'out_of_memory'
+    finally:
+        if timeout:
+            signal.setitimer(signal.ITIMER_REAL, 0)
+        if cache is not None:
+            cache.close()
+    row['wall_time'] = round(time.time() - time_start, 3)
+    row['nodes_expanded'] = stats.expanded
+    write_solution(path, outputfile, output_format)
+    return row
+
+
+def solve_batch(pattern, outputdir, algorithm, heuristic, workers=None, timeout=None, memory_limit=None,
+                summary=None, output_format='boards', cache_file=None, **options):
+    """
+    Solve every puzzle file in a directory, or matching a glob pattern, across a pool of
+    worker processes. Each solution is written to <outputdir>/<puzzle name>.sol in the
+    same format as a single solve, and a CSV summary with the status, cost, nodes expanded
+    and wall time of every puzzle is written to `summary` (by default, summary.csv in the
+    output directory). With a cache, only the puzzles it has no result for are searched.
+
+    :param pattern: A directory of puzzle files, or a glob pattern matching puzzle files.
+    :type pattern: str
+    :param outputdir: The directory the solutions are written to.
+    :type outputdir: str
+    :param algorithm: the search algorithm, one of ALGORITHMS
+    :type algorithm: str
+    :param heuristic: the heuristic, one of HEURISTICS
+    :type heuristic: str
+    :param workers: The number of worker processes, or None for one per CPU.
+    :type workers: Optional[int]
+    :param timeout: The time limit in seconds per puzzle, or None for no limit.
+    :type timeout: Optional[float]
+    :param memory_limit: The memory limit in megabytes per worker, or None for no limit.
+    :type memory_limit: Optional[int]
+    :param summary: The CSV file the summary is written to.
+    :type summary: Optional[str]
+    :param output_format: The format of the solution files, 'boards' or 'moves'.
+    :type output_format: str
+    :param cache_file: The SQLite file of the SolutionCache shared by the workers, if any.
+    :type cache_file: Optional[str]
+    :param options: Further keyword arguments to search, e.g. weight.
+    :return: The summary rows, in puzzle order.
+    :rtype: List[dict]
+    """
+    if os.path.isdir(pattern):
+        inputfiles = sorted(os.path.join(pattern, name) for name in os.listdir(pattern)
+                            if os.path.isfile(os.path.join(pattern, name)))
+    else:
+        inputfiles = sorted(glob.glob(pattern))
+    os.makedirs(outputdir, exist_ok=True)
+
+    with ProcessPoolExecutor(max_workers=workers, initializer=_limit_memory, initargs=(memory_limit,)) as pool:
+        futures = []
+        for inputfile in inputfiles:
+            outputfile = os.path.join(outputdir, os.path.splitext(os.path.basename(inputfile))[0] + '.sol')
+            futures.append(pool.submit(_solve_file, inputfile, outputfile, algorithm, heuristic, timeout,
+                                       output_format, cache_file, options))
+        rows = []
+        for inputfile, future in zip(inputfiles, futures):
+            try:
+                rows.append(future.result())
+            except Exception as error:  # e.g. a worker killed by the memory limit
+                rows.append({'puzzle': os.path.basename(inputfile), 'status': 'error: {}'.format(error),
+                             'cost': -1, 'nodes_expanded': 0, 'wall_time': 0.0, 'cached': False})
+
+    summary_file = open(summary or os.path.join(outputdir, 'summary.csv'), "w", newline='')
+    writer = csv.DictWriter(summary_file, fieldnames=['puzzle', 'status', 'cost', 'nodes_expanded', 'wall_time',
+                                                           'cached'])
+    writer.writeheader()
+    writer.writerows(rows)
+    summary_file.close()
+    return rows
+
+
+# The puzzle tiers of the corpus, from smallest to largest: (width, height, boxes, robots,
+# fewest pushes). A puzzle of a tier cannot be solved in fewer than its fewest pushes.
+BENCHMARK_TIERS = ((6, 6, 1, 1, 3), (7, 7, 2, 1, 5), (8, 8, 2, 2, 7), (8, 8, 3, 1, 8), (9, 9, 3, 2, 9),
+                   (10, 10, 4, 1, 10), (10, 10, 4, 2, 12))
+# Number of puzzles generated for each tier.
+PUZZLES_PER_TIER = 3
+# Seed of the corpus; the same seed always gives the same puzzles.
+BENCHMARK_SEED = 384
+# Fraction of the inside of a generated room that is turned into walls.
+WALL_DENSITY = 0.15
+# Number of reverse moves made per box when scrambling a solved puzzle.
+REVERSE_MOVES_PER_BOX = 40
+# Default time limit in seconds per run.
+BENCHMARK_TIMEOUT = 10.0
+# Default largest relative drop in nodes per second, or rise in memory, before a run is
+# reported as a regression against the baseline.
+REGRESSION_TOLERANCE = 0.2
+# Shortest run in seconds whose nodes per second count towards the rate of its algorithm;
+# shorter runs are mostly start-up time.
+BENCHMARK_MIN_TIME = 0.5
+# Puzzles of known optimal cost that the corpus always includes, as (name, rows, cost):
+# every algorithm must solve them, and those in OPTIMAL_ALGORITHMS at that cost.
+KNOWN_PUZZLES = (
+    # two robots that each push a box outwards; a heuristic built for one robot finds no way.
+    ('corridor-r2', ('##########',
+                     '#a? .. ?b#',
+                     '##########'), 4),
+)
+# The algorithms whose solutions are always optimal.
+OPTIMAL_ALGORITHMS = ('a_star', 'ida_star', 'hda_star', 'bfs')
+
+
+def generate_puzzle(name, width, height, num_boxes, num_robots, seed, min_pushes=1):
+    """
+    Generate a solvable puzzle by reverse play: the boxes start on their storage points,
+    and the robots then walk at random, pulling every box they step away from. Every pull
+    undoes a push, so each board of the walk can be solved by playing the moves forwards
+    again. The puzzle is the board of the walk whose boxes are the most pushes from
+    storage, by heuristic_matching; walks that never get `min_pushes` away are retried.
+
+    :param name: The name of the puzzle.
+    :type name: str
+    :param width: The width of the puzzle, walls included.
+    :type width: int
+    :param height: The height of the puzzle, walls included.
+    :type height: int
+    :param num_boxes: The number of boxes (and storage points).
+    :type num_boxes: int
+    :param num_robots: The number of robots.
+    :type num_robots: int
+    :param seed: The seed of the random moves.
+    :type seed: int
+    :param min_pushes: The fewest pushes the puzzle may be solved with, at least.
+    :type min_pushes: int
+    :return: the generated Board
+    :rtype: Board
+    """
+    rng = random.Random(seed)
+    while True:
+        obstacles = _generate_walls(rng, width, height)
+        free = [(x, y) for y in range(height) for x in range(width) if (x, y) not in obstacles]
+        if len(free) < num_boxes + num_robots + 2:
+            continue
+        cells = rng.sample(free, num_boxes + num_robots)
+        storage = cells[:num_boxes]
+        board = Board(name, width, height, cells[num_boxes:], storage, storage, sorted(obstacles))
+        level = board.level
+        robots = list(board.robot_cells)
+        box_mask = board.box_mask
+        key = board.key
+        best = None
+        best_pushes = 0
+
+        for _ in range(REVERSE_MOVES_PER_BOX * num_boxes):
+            i = rng.randrange(num_robots)
+            robot = robots[i]
+            moves = [direction for direction in range(4)
+                     if not level.walls[level.steps[direction][robot]]
+                     and not box_mask >> level.steps[direction][robot] & 1
+                     and level.steps[direction][robot] not in robots]
+            if not moves:
+                continue
+            # a robot next to a box always pulls one, if it can.
+            pulls = [direction for direction in moves if box_mask >> level.steps[(direction + 2) % 4][robot] & 1]
+            direction = rng.choice(pulls or moves)
+            target = level.steps[direction][robot]
+            robots[i] = target
+            key ^= level.robot_keys[robot] ^ level.robot_keys[target]
+            behind = level.steps[(direction + 2) % 4][robot]
+            if not box_mask >> behind & 1:
+                continue
+            box_mask ^= (1 << behind) | (1 << robot)
+            key ^= level.box_keys[behind] ^ level.box_keys[robot]
+            candidate = board.derive(tuple(robots), box_mask, key)
+            pushes = heuristic_matching(candidate)
+            if pushes > best_pushes:
+                best, best_pushes = candidate, pushes
+
+        if best_pushes >= min_pushes:
+            # the search must not start with the matchings of the walk already remembered.
+            level.memo.clear()
+            return best
+
+
+def _generate_walls(rng, width, height):
+    """
+    Return the walls of a random room: its border, and inner walls placed one at a time
+    as long as the free cells stay connected.
+    """
+    obstacles = {(x, y) for y in range(height) for x in range(width)
+                 if x in (0, width - 1) or y in (0, height - 1)}
+    inside = [(x, y) for y in range(1, height - 1) for x in range(1, width - 1)]
+    for cell in rng.sample(inside, int(len(inside) * WALL_DENSITY)):
+        obstacles.add(cell)
+        if not _is_connected(obstacles, width, height):
+            obstacles.remove(cell)
+    return obstacles
+
+
+def _is_connected(obstacles, width, height):
+    free = {(x, y) for y in range(height) for x in range(width) if (x, y) not in obstacles}
+    start = next(iter(free))
+    reached = {start}
+    stack = [start]
+    while stack:
+        x, y = stack.pop()
+        for dx, dy in DIRECTIONS:
+            cell = (x + dx, y + dy)
+            if cell in free and cell not in reached:
+                reached.add(cell)
+                stack.append(cell)
+    return len(reached) == len(free)
+
+
+def generate_corpus(seed=BENCHMARK_SEED, tiers=BENCHMARK_TIERS, count=PUZZLES_PER_TIER):
+    """
+    Generate the benchmark corpus: the KNOWN_PUZZLES, then `count` puzzles for each tier,
+    in order of tier.
+
+    :param seed: The seed of the corpus.
+    :type seed: int
+    :param tiers: The (width, height, boxes, robots, fewest pushes) of each tier.
+    :type tiers: Sequence[tuple]
+    :param count: The number of puzzles per tier.
+    :type count: int
+    :rtype: List[Board]
+    """
+    rng = random.Random(seed)
+    puzzles = [known_puzzle(name) for name, rows, cost in KNOWN_PUZZLES]
+    for width, height, num_boxes, num_robots, min_pushes in tiers:
+        for i in range(count):
+            name = '{}x{}-b{}-r{}-{}'.format(width, height, num_boxes, num_robots, i)
+            puzzles.append(generate_puzzle(name, width, height, num_boxes, num_robots, rng.getrandbits(32),
+                                           min_pushes))
+    return puzzles
+
+
+def known_puzzle(name):
+    """
+    Return the board of the puzzle of KNOWN_PUZZLES with the given name.
+    """
+    for known_name, rows, cost in KNOWN_PUZZLES:
+        if known_name == name:
+            width = max(len(row) for row in rows)
+            return read_from_lines([name, str(width), str(len(rows))] + list(rows))
+    raise KeyError(name)
+
+
+def check_known_puzzles(runs):
+    """
+    Check the runs on the KNOWN_PUZZLES against their known cost, and return a description
+    of every run that did not solve its puzzle, or solved it at the wrong cost. A timeout is
+    not counted, as it says nothing about the result.
+
+    :param runs: The runs, as returned by run_benchmark.
+    :type runs: List[dict]
+    :rtype: List[str]
+    """
+    costs = {name: cost for name, rows, cost in KNOWN_PUZZLES}
+    errors = []
+    for run in runs:
+        cost = costs.get(run['puzzle'])
+        if cost is None or run['status'] in ('timeout', 'killed', 'out_of_memory'):
+            continue
+        if run['status'] != 'solved' or (run['algorithm'] in OPTIMAL_ALGORITHMS and run['cost'] != cost):
+            errors.append('{}/{} on {}: {} with cost {}, expected cost {}'.format(
+                run['algorithm'], run['heuristic'], run['puzzle'], run['status'], run['cost'], cost))
+    return errors
+
+
+def write_puzzle(board, filename):
+    """
+    Save the puzzle to the given file, in the format read_from_file reads.
+    """
+    puzzle_file = open(filename, "w")
+    print(board.name, file=puzzle_file)
+    print(board.width, file=puzzle_file)
+    print(board.height, file=puzzle_file)
+    print(board, end='', file=puzzle_file)
+    puzzle_file.close()
+
+
+def _run_benchmark(connection, board, algorithm, heuristic, timeout):
+    """
+    Run one search in a fresh process and send its result back over the connection.
+    """
+    result = {'status': 'solved', 'cost': -1}
+    stats = SearchStats()
+    # the process starts with the memory of the benchmark itself; only the growth is the search's.
+    memory_start = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss if resource else None
+    signal.signal(signal.SIGALRM, _raise_timeout)
+    signal.setitimer(signal.ITIMER_REAL, timeout)
+    time_start = time.perf_counter()
+    try:
+        path, result['cost'] = search(board, algorithm, HEURISTICS[heuristic], stats=stats)
+        if not path:
+            result['status'] = 'unsolvable'
+    except SearchTimeout:
+        result['status'] = 'timeout'
+    except MemoryError:
+        result['status'] = 'out_of_memory'
+    finally:
+        signal.setitimer(signal.ITIMER_REAL, 0)
+    result['time'] = time.perf_counter() - time_start
+    result['expanded'] = stats.expanded
+    result['generated'] = stats.generated
+    result['nodes_per_sec'] = stats.expanded / result['time'] if result['time'] > 0 else 0.0
+    # ru_maxrss is in kilobytes on Linux.
+    result['memory_mb'] = ((resource.getrusage(resource.RUSAGE_SELF).ru_maxrss - memory_start) / 1024
+                           if resource else None)
+    connection.send(result)
+    connection.close()
+
+
+def run_benchmark(puzzles, algorithms, heuristics, timeout=BENCHMARK_TIMEOUT):
+    """
+    Run every algorithm with every heuristic on every puzzle. Each run has a process of
+    its own, so that its memory is not inflated by the runs before it.
+
+    :param puzzles: The puzzles.
+    :type puzzles: List[Board]
+    :param algorithms: The algorithms, from ALGORITHMS.
+    :type algorithms: List[str]
+    :param heuristics: The heuristics, from HEURISTICS.
+    :type heuristics: List[str]
+    :param timeout: The time limit in seconds per run.
+    :type timeout: float
+    :return: one dict per run, with its puzzle, algorithm, heuristic, status, cost, expanded
+             and generated nodes, time, nodes per second and the growth of its memory peak
+             during the search, in megabytes.
+    :rtype: List[dict]
+    """
+    context = multiprocessing.get_context()
+    runs = []
+    for algorithm in algorithms:
+        for heuristic in heuristics:
+            for board in puzzles:
+                receiver, sender = context.Pipe(duplex=False)
+                process = context.Process(target=_run_benchmark, args=(sender, board, algorithm, heuristic, timeout))
+                process.start()
+                sender.close()
+                # the search stops itself at the time limit; the grace period covers the rest.
+                if receiver.poll(timeout + 5):
+                    result = receiver.recv()
+                else:
+                    result = {'status': 'killed', 'cost': -1, 'time': timeout, 'expanded': 0, 'generated': 0,
+                              'nodes_per_sec': 0.0, 'memory_mb': None}
+                process.join(1)
+                if process.is_alive():
+                    process.terminate()
+                receiver.close()
+                result.update(puzzle=board.name, algorithm=algorithm, heuristic=heuristic)
+                runs.append(result)
+    return runs
+
+
+def summarize_benchmark(runs):
+    """
+    Sum up the runs of every algorithm and heuristic: the solve rate, the nodes expanded
+    per second over the runs that took at least BENCHMARK_MIN_TIME, or None if none did,
+    and the largest memory growth of a solved run. Runs that time out are left out of the
+    memory, as how far they get depends on the speed of the machine.
+
+    :param runs: The runs, as returned by run_benchmark.
+    :type runs: List[dict]
+    :return: a dict from 'algorithm/heuristic' to its summary.
+    :rtype: dict
+    """
+    summary = {}
+    for run in runs:
+        entry = summary.setdefault('{}/{}'.format(run['algorithm'], run['heuristic']),
+                                   {'runs': 0, 'solved': 0, 'timed_runs': 0, 'expanded': 0, 'time': 0.0,
+                                    'memory_mb': 0.0})
+        entry['runs'] += 1
+        entry['solved'] += run['status'] == 'solved'
+        if run['time'] >= BENCHMARK_MIN_TIME and run['expanded']:
+            entry['timed_runs'] += 1
+            entry['expanded'] += run['expanded']
+            entry['time'] += run['time']
+        if run['status'] == 'solved':
+            entry['memory_mb'] = max(entry['memory_mb'], run['memory_mb'] or 0.0)
+    for entry in summary.values():
+        entry['solve_rate'] = entry['solved'] / entry['runs']
+        entry['nodes_per_sec'] = entry['expanded'] / entry['time'] if entry['timed_runs'] else None
+    return summary
+
+
+def compare_benchmark(results, baseline, tolerance=REGRESSION_TOLERANCE):
+    """
+    Compare benchmark results against a baseline and return the regressions: a lower
+    solve rate, a higher cost on a puzzle both solved, or nodes per second or a memory
+    growth more than `tolerance` worse than the baseline. Nodes per second are compared
+    only where both have runs long enough to give a rate.
+
+    :param results: The results, as saved by the benchmark.
+    :type results: dict
+    :param baseline: The baseline results, in the same format.
+    :type baseline: dict
+    :param tolerance: The largest relative change allowed in speed and memory.
+    :type tolerance: float
+    :return: a description of every regression found.
+    :rtype: List[str]
+    """
+    regressions = []
+    for combination, entry in results['summary'].items():
+        old = baseline['summary'].get(combination)
+        if old is None:
+            continue
+        if entry['solve_rate'] < old['solve_rate']:
+            regressions.append('{}: solve rate {:.0%} -> {:.0%}'.format(
+                combination, old['solve_rate'], entry['solve_rate']))
+        if entry['nodes_per_sec'] and old['nodes_per_sec'] and \
+                entry['nodes_per_sec'] < old['nodes_per_sec'] * (1 - tolerance):
+            regressions.append('{}: {:.0f} -> {:.0f} nodes/s'.format(
+                combination, old['nodes_per_sec'], entry['nodes_per_sec']))
+        if old['memory_mb'] and entry['memory_mb'] > old['memory_mb'] * (1 + tolerance):
+            regressions.append('{}: memory growth {:.1f} -> {:.1f} MB'.format(
+                combination, old['memory_mb'], entry['memory_mb']))
+
+    costs = {(run['puzzle'], run['algorithm'], run['heuristic']): run['cost']
+             for run in baseline['runs'] if run['status'] == 'solved'}
+    for run in results['runs']:
+        cost = costs.get((run['puzzle'], run['algorithm'], run['heuristic']))
+        if run['status'] == 'solved' and cost is not None and run['cost'] > cost:
+            regressions.append('{}/{} on {}: cost {} -> {}'.format(
+                run['algorithm'], run['heuristic'], run['puzzle'], cost, run['cost']))
+    return regressions
+
+
 if __name__ == "__main__":
 
     parser = argparse.ArgumentParser()
     parser.add_argument(
         "--inputfile",
         type=str,
-        required=True,
+        required=False,
         help="The file that contains the puzzle."
     )
     parser.add_argument(
         "--outputfile",
         type=str,
-        required=True,
+        required=False,
         help="The file that contains the solution to the puzzle."
     )
+    parser.add_argument(
+        "--batch",
+        type=str,
+        required=False,
+        help="A directory or glob pattern of puzzle files to solve in parallel instead of --inputfile."
+    )
+    parser.add_argument(
+        "--outputdir",
+        type=str,
+        required=False,
+        default="solutions",
+        help="The directory the batch solutions and summary are written to."
+    )
+    parser.add_argument(
+        "--summary",
+        type=str,
+        required=False,
+        default=None,
+        help="The CSV file the batch summary is written to (default: summary.csv in --outputdir)."
+    )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        required=False,
+        default=None,
+        help="The number of batch worker processes (default: one per CPU)."
+    )
+    parser.add_argument(
+        "--timeout",
+        type=float,
+        required=False,
+        default=None,
+        help="The time limit in seconds per batch puzzle (default: none), or per benchmark run (default: {}).".format(
+            BENCHMARK_TIMEOUT)
+    )
+    parser.add_argument(
+        "--memory-limit",
+        type=int,
+        required=False,
+        default=None,
+        help="The memory limit in megabytes per batch worker."
+    )
     parser.add_argument(
         "--algorithm",
         type=str,
-        required=True,
-        choices=['a_star', 'dfs'],
+        required=False,
+        choices=list(ALGORITHMS),
         help="The searching algorithm."
     )
     parser.add_argument(
-        "--heuristic",
+        "--depth-limit",
+        type=int,
+        required=False,
+        default=None,
+        help="The largest depth searched by DFS."
+    )
+    parser.add_argument(
+        "--tt-size",
+        type=int,
+        required=False,
+        default=TRANSPOSITION_TABLE_SIZE,
+        help="The largest number of boards in the IDA* transposition table."
+    )
+    parser.add_argument(
+        "--weight",
+        type=float,
+        required=False,
+        default=WEIGHT,
+        help="The weight on the heuristic for weighted and anytime A*."
+    )
+    parser.add_argument(
+        "--weight-decrement",
+        type=float,
+        required=False,
+        default=WEIGHT_DECREMENT,
+        help="The amount anytime A* lowers the weight by after each solution; must be positive."
+    )
+    parser.add_argument(
+        "--search-workers",
+        type=int,
+        required=False,
+        default=None,
+        help="The number of HDA* worker processes (default: one per CPU)."
+    )
+    parser.add_argument(
+        "--stats",
         type=str,
         required=False,
         default=None,
-        choices=['zero', 'basic', 'advanced'],
+        help="The file the search statistics are saved to as JSON."
+    )
+    parser.add_argument(
+        "--output-format",
+        type=str,
+        required=False,
+        default='boards',
+        choices=['boards', 'moves'],
+        help="Save every board of the solution, or the initial board and a move string such as uLdR."
+    )
+    parser.add_argument(
+        "--cache",
+        type=str,
+        nargs='?',
+        required=False,
+        default=None,
+        const=CACHE_FILE,
+        help="Look solutions up in, and save them to, an SQLite cache (default file: {}).".format(
+            os.path.basename(CACHE_FILE))
+    )
+    parser.add_argument(
+        "--macros",
+        action="store_true",
+        help="Push boxes through tunnels and into goal rooms as single moves, on boards with a single robot."
+    )
+    parser.add_argument(
+        "--heuristic",
+        type=str,
+        required=False,
+        default='zero',
+        choices=list(HEURISTICS),
         help="The heuristic used for any heuristic search."
     )
+    parser.add_argument(
+        "--benchmark",
+        type=str,
+        nargs='?',
+        required=False,
+        default=None,
+        const="benchmark.json",
+        help="Benchmark the algorithms on a generated puzzle corpus instead of solving a puzzle, and save the "
+             "results to this file (default: benchmark.json)."
+    )
+    parser.add_argument(
+        "--algorithms",
+        type=str,
+        nargs='+',
+        required=False,
+        default=list(ALGORITHMS),
+        choices=list(ALGORITHMS),
+        help="The searching algorithms to benchmark (default: all)."
+    )
+    parser.add_argument(
+        "--heuristics",
+        type=str,
+        nargs='+',
+        required=False,
+        default=list(HEURISTICS),
+        choices=list(HEURISTICS),
+        help="The heuristics to benchmark (default: all)."
+    )
+    parser.add_argument(
+        "--seed",
+        type=int,
+        required=False,
+        default=BENCHMARK_SEED,
+        help="The seed of the benchmark puzzles."
+    )
+    parser.add_argument(
+        "--tiers",
+        type=int,
+        required=False,
+        default=len(BENCHMARK_TIERS),
+        help="The number of puzzle sizes to benchmark, from the smallest."
+    )
+    parser.add_argument(
+        "--corpus",
+        type=str,
+        required=False,
+        default=None,
+        help="A directory to save the benchmark puzzles to, e.g. for --batch."
+    )
+    parser.add_argument(
+        "--baseline",
+        type=str,
+        required=False,
+        default=None,
+        help="Benchmark results to compare against; the exit status is 1 if there are regressions."
+    )
+    parser.add_argument(
+        "--tolerance",
+        type=float,
+        required=False,
+        default=REGRESSION_TOLERANCE,
+        help="The largest relative drop in nodes/s, or rise in memory, allowed against the baseline."
+    )
     args = parser.parse_args()
+    if args.weight_decrement <= 0:
+        parser.error("--weight-decrement must be positive")
+    if args.benchmark is None and args.algorithm is None:
+        parser.error("--algorithm is required unless --benchmark is given")
+    if args.benchmark is None and args.batch is None and (args.inputfile is None or args.outputfile is None):
+        parser.error("--inputfile and --outputfile are required unless --batch or --benchmark is given")
+
+    if args.benchmark is not None:
+        puzzles = generate_corpus(args.seed, BENCHMARK_TIERS[:args.tiers])
+        if args.corpus is not None:
+            os.makedirs(args.corpus, exist_ok=True)
+            for board in puzzles:
+                write_puzzle(board, os.path.join(args.corpus, board.name + '.txt'))
+
+        timeout = args.timeout or BENCHMARK_TIMEOUT
+        runs = run_benchmark(puzzles, args.algorithms, args.heuristics, timeout)
+        results = {'seed': args.seed, 'timeout': timeout, 'runs': runs, 'summary': summarize_benchmark(runs)}
+        outputfile = open(args.benchmark, "w")
+        json.dump(results, outputfile, indent=2)
+        outputfile.close()
+
+        for combination, entry in results['summary'].items():
+            rate = '{:.0f} nodes/s over {} runs'.format(entry['nodes_per_sec'], entry['timed_runs']) \
+                if entry['timed_runs'] else 'no run long enough for a rate'
+            print('{}: solved {}/{}, {}, memory growth {:.1f} MB'.format(
+                combination, entry['solved'], entry['runs'], rate, entry['memory_mb']))
+
+        errors = check_known_puzzles(runs)
+        for error in errors:
+            print('Wrong result: {}'.format(error))
+        if errors:
+            raise SystemExit(1)
+
+        if args.baseline is not None:
+            baseline_file = open(args.baseline, "r")
+            baseline = json.load(baseline_file)
+            baseline_file.close()
+            regressions = compare_benchmark(results, baseline, args.tolerance)
+            for regression in regressions:
+                print('Regression: {}'.format(regression))
+            if regressions:
+                raise SystemExit(1)
+            print('No regressions against {}'.format(args.baseline))
+    elif args.batch is not None:
+        rows = solve_batch(args.batch, args.outputdir, args.algorithm, args.heuristic, args.workers, args.timeout,
+                           args.memory_limit, args.summary, args.output_format, args.cache,
+                           depth_limit=args.depth_limit, table_size=args.tt_size, weight=args.weight,
+                           weight_decrement=args.weight_decrement, search_workers=args.search_workers,
+                           macros=args.macros)
+        for row in rows:
+            print('{puzzle}: {status}{}, cost {cost}, {nodes_expanded} nodes expanded, {wall_time:.2f}s'.format(
+                ' (cached)' if row['cached'] else '', **row))
+    else:
+        # set the heuristic function
+        heuristic = HEURISTICS[args.heuristic]
 
-    # set the heuristic function
-    heuristic = heuristic_zero
-    if args.heuristic == 'basic':
-        heuristic = heuristic_basic
-    elif args.heuristic == 'advanced':
-        heuristic = heuristic_advanced
-
-    # read the boards from the file
-    board = read_from_file(args.inputfile)
+        # read the boards from the file
+        board = read_from_file(args.inputfile)
 
-    # solve the puzzles
-    path = solve_puzzle(board, args.algorithm, heuristic)
+        # solve the puzzles
+        path = solve_puzzle(board, args.algorithm, heuristic, args.depth_limit, args.tt_size, args.weight,
+                            args.weight_decrement, args.search_workers, args.stats, args.output_format, args.cache,
+                            args.macros)
 
-    # save solution in output file
-    outputfile = open(args.outputfile, "w")
-    counter = 1
-    for state in path:
-        print(counter, file=outputfile)
-        print(state.board, file=outputfile)
-        counter += 1
-    outputfile.close()
+        # save solution in output file
+        write_solution(path, args.outputfile, args.output_format)